@@ -0,0 +1,397 @@
+from os import listdir
+from os.path import abspath
+from os.path import dirname
+from os.path import join
+from tempfile import TemporaryDirectory
+from timeit import default_timer as timer
+import argparse
+import logging
+import tkinter as tk
+
+from PIL import Image  # type: ignore
+import numpy as np
+
+from color_palette import Palette
+from main import setup_logger
+from model import ModelCrop
+from photo_info import load_thumb_data
+from render_pool import RenderPool
+from view import FrameCrop
+
+
+def parse_arguments():
+    """Setup CLI interface"""
+    parser = argparse.ArgumentParser(description="Time the slow paths of the viewer")
+
+    parser.add_argument(
+        "-lld",
+        "--log_level_debug",
+        type=str,
+        default="WARN",
+        help="Level for the debugging logger",
+        choices=["TRACE", "DEBUG", "INFO", "WARN", "ERROR", "CRITICAL"],
+    )
+
+    subparsers = parser.add_subparsers(dest="bench", required=True)
+
+    parser_thumb = subparsers.add_parser("thumb", help="Thumbnail decoding modes")
+    parser_thumb.add_argument(
+        "-sn",
+        "--synth_num",
+        type=int,
+        default=10,
+        help="Number of synthetic JPEG to generate",
+    )
+    parser_thumb.add_argument(
+        "-ss",
+        "--synth_size",
+        type=int,
+        nargs=2,
+        default=[6000, 4000],
+        help="Dimensions of the synthetic JPEG",
+    )
+    parser_thumb.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        default=3,
+        help="How many times each set is loaded, the best run is kept",
+    )
+
+    parser_crop = subparsers.add_parser("crop", help="Render time at each zoom")
+    parser_crop.add_argument(
+        "-ss",
+        "--synth_size",
+        type=int,
+        nargs=2,
+        default=[6000, 4000],
+        help="Dimensions of the synthetic JPEG",
+    )
+    parser_crop.add_argument(
+        "-ws",
+        "--widget_size",
+        type=int,
+        nargs=2,
+        default=[1920, 1080],
+        help="Dimensions of the widget where the photo is shown",
+    )
+    parser_crop.add_argument(
+        "-zs",
+        "--zoom_steps",
+        type=int,
+        default=4,
+        help="How many times to zoom out from the fit zoom",
+    )
+    parser_crop.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        default=5,
+        help="How many times each interaction is done, the best run is kept",
+    )
+
+    parser_double = subparsers.add_parser(
+        "double", help="Latency of prim and echo, in sequence and in parallel"
+    )
+    parser_double.add_argument(
+        "-ss",
+        "--synth_size",
+        type=int,
+        nargs=2,
+        default=[6000, 4000],
+        help="Dimensions of the synthetic JPEG",
+    )
+    parser_double.add_argument(
+        "-ws",
+        "--widget_size",
+        type=int,
+        nargs=2,
+        default=[960, 1080],
+        help="Dimensions of each of the two widgets",
+    )
+    parser_double.add_argument(
+        "-r",
+        "--repeat",
+        type=int,
+        default=5,
+        help="How many times each interaction is done, the best run is kept",
+    )
+
+    parser_display = subparsers.add_parser(
+        "display", help="Frames per second while dragging, needs a display"
+    )
+    parser_display.add_argument(
+        "-ss",
+        "--synth_size",
+        type=int,
+        nargs=2,
+        default=[6000, 4000],
+        help="Dimensions of the synthetic JPEG",
+    )
+    parser_display.add_argument(
+        "-ws",
+        "--widget_size",
+        type=int,
+        nargs=2,
+        default=[1920, 1080],
+        help="Dimensions of the widget where the photo is shown",
+    )
+    parser_display.add_argument(
+        "-nf",
+        "--num_frames",
+        type=int,
+        default=200,
+        help="How many frames are drawn while dragging",
+    )
+
+    # last line to parse the args
+    args = parser.parse_args()
+    return args
+
+
+def generate_synthetic(folder, num, size):
+    """Save num noisy JPEG of the given size in folder"""
+    logui = logging.getLogger("UI")
+    logui.info(f"Generating {num} synthetic pics {size[0]}x{size[1]}")
+
+    rng = np.random.default_rng(42)
+    wid, hei = size
+    # smooth gradients plus noise, a bit more realistic than pure noise
+    grad_x, grad_y = np.meshgrid(
+        np.linspace(0, 255, wid, dtype=np.float32),
+        np.linspace(0, 255, hei, dtype=np.float32),
+    )
+    base = np.stack([grad_x, grad_y, (grad_x + grad_y) / 2], axis=2)
+    for i in range(num):
+        noise = rng.normal(0, 20, (hei, wid, 3)).astype(np.float32)
+        pixels = np.clip(base + noise, 0, 255).astype(np.uint8)
+        Image.fromarray(pixels).save(join(folder, f"synth_{i:04d}.jpg"), quality=90)
+
+
+def time_thumbs(photo_list, thumb_mode, repeat):
+    """Best time to load the thumbnails of all the pics"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = timer()
+        for photo_full in photo_list:
+            load_thumb_data(photo_full, 50, thumb_mode)
+        best = min(best, timer() - start)
+    return best
+
+
+def bench_thumb(args):
+    """Compare the thumb_mode of load_thumb_data, speedup is against full
+
+    The synthetic pics have no EXIF, so exif falls back to draft there
+    """
+    dir_file = abspath(dirname(__file__))
+    meta_folder = join(dir_file, "img_meta")
+    meta_list = [join(meta_folder, p) for p in sorted(listdir(meta_folder))]
+
+    with TemporaryDirectory() as synth_folder:
+        generate_synthetic(synth_folder, args.synth_num, args.synth_size)
+        synth_list = [join(synth_folder, p) for p in sorted(listdir(synth_folder))]
+
+        sets = {"img_meta": meta_list, "synthetic": synth_list}
+        thumb_modes = ("full", "draft", "exif")
+        header = f"{'set':>10} {'pics':>5}"
+        header += "".join(f" {m:>9} {'speedup':>8}" for m in thumb_modes)
+        print(header)
+        for set_name, photo_list in sets.items():
+            recap = f"{set_name:>10} {len(photo_list):>5}"
+            for thumb_mode in thumb_modes:
+                t_mode = time_thumbs(photo_list, thumb_mode, args.repeat)
+                if thumb_mode == "full":
+                    t_full = t_mode
+                recap += f" {t_mode:8.3f}s {t_full / t_mode:7.2f}x"
+            print(recap)
+
+
+def time_zooms(photo_full, widget_size, zoom_steps, use_pyramid, repeat):
+    """Time the zoom interactions, from fit out zoom_steps times and back in
+
+    Returns ({zoom_level: (best time, time of the first run)}, {zoom_level:
+    pyramid level used})
+    """
+    cropper = ModelCrop(photo_full)
+    cropper.use_pyramid = use_pyramid
+    cropper.decode()
+    cropper.reset_image(*widget_size)
+    directions = ["out"] * zoom_steps + ["in"] * (zoom_steps + 2)
+
+    times = {}
+    levels = {}
+    for _ in range(repeat):
+        cropper.reset_image()
+        for direction in directions:
+            start = timer()
+            cropper.zoom_image(direction)
+            cropper.render()
+            t_zoom = timer() - start
+            zoom_level = round(cropper._zoom_level, 2)
+            levels[zoom_level] = cropper._pick_level()
+            best, first = times.get(zoom_level, (float("inf"), t_zoom))
+            times[zoom_level] = (min(best, t_zoom), first)
+    return times, levels
+
+
+def bench_crop(args):
+    """Compare the render time with and without the pyramid, at each zoom
+
+    The first run includes building the pyramid levels
+    """
+    with TemporaryDirectory() as synth_folder:
+        generate_synthetic(synth_folder, 1, args.synth_size)
+        photo_full = join(synth_folder, "synth_0000.jpg")
+
+        t_full, _ = time_zooms(
+            photo_full, args.widget_size, args.zoom_steps, False, args.repeat
+        )
+        t_pyramid, levels = time_zooms(
+            photo_full, args.widget_size, args.zoom_steps, True, args.repeat
+        )
+
+    header = f"{'zoom_level':>10} {'zoom':>6} {'level':>5}"
+    header += f" {'full':>9} {'pyramid':>9} {'first':>9} {'speedup':>8}"
+    print(header)
+    for zoom_level in sorted(t_full):
+        zoom = 2 ** (zoom_level / 2)
+        full_best = t_full[zoom_level][0]
+        pyr_best, pyr_first = t_pyramid[zoom_level]
+        recap = f"{zoom_level:>10.2f} {zoom:>6.3f} {levels[zoom_level]:>5}"
+        recap += f" {full_best * 1000:7.1f}ms {pyr_best * 1000:7.1f}ms"
+        recap += f" {pyr_first * 1000:7.1f}ms {full_best / pyr_best:7.2f}x"
+        print(recap)
+
+
+def time_double(photo_prim, photo_echo, widget_size, num_workers, repeat):
+    """Time the interactions on prim, cloned to echo as Model does
+
+    Returns {interaction: best time}
+    """
+    crop_prim = ModelCrop(photo_prim).decode()
+    crop_echo = ModelCrop(photo_echo).decode()
+    # the panning is timed without the shift, to resample the whole crop
+    crop_prim.use_pan_shift = False
+    crop_echo.use_pan_shift = False
+    render_pool = RenderPool(num_workers)
+
+    interactions = {
+        "reset": lambda: crop_prim.reset_image(*widget_size),
+        "zoom preview": lambda: crop_prim.zoom_image("in", preview=True),
+        "refine": lambda: crop_prim.update_crop(),
+        "pan": lambda: crop_prim.move_image(10, 10),
+        "zoom out": lambda: crop_prim.zoom_image("out", steps=2),
+    }
+    times = {}
+    for _ in range(repeat):
+        for name, interaction in interactions.items():
+            start = timer()
+            interaction()
+            crop_echo.load_params(crop_prim.get_params(), crop_prim._render_preview)
+            render_pool.render((crop_prim, crop_echo))
+            t_interaction = timer() - start
+            times[name] = min(times.get(name, float("inf")), t_interaction)
+    render_pool.close()
+    return times
+
+
+def bench_double(args):
+    """Compare rendering prim and echo in sequence and in the RenderPool"""
+    with TemporaryDirectory() as synth_folder:
+        generate_synthetic(synth_folder, 2, args.synth_size)
+        photo_prim = join(synth_folder, "synth_0000.jpg")
+        photo_echo = join(synth_folder, "synth_0001.jpg")
+
+        t_seq = time_double(photo_prim, photo_echo, args.widget_size, 0, args.repeat)
+        t_par = time_double(photo_prim, photo_echo, args.widget_size, 1, args.repeat)
+
+    print(f"{'interaction':>12} {'sequence':>9} {'parallel':>9} {'speedup':>8}")
+    for name in t_seq:
+        recap = f"{name:>12} {t_seq[name] * 1000:7.1f}ms {t_par[name] * 1000:7.1f}ms"
+        recap += f" {t_seq[name] / t_par[name]:7.2f}x"
+        print(recap)
+
+
+def time_drag(root, photo_full, widget_size, display_backend, num_frames):
+    """Drag the zoomed in photo in a FrameCrop, one frame per step
+
+    Returns (seconds per frame, seconds per frame spent in the view)
+    """
+    frame = FrameCrop(
+        root,
+        name="frame_crop.prim",
+        palette=Palette("blue1"),
+        display_backend=display_backend,
+    )
+    frame.grid(row=0, column=0, sticky="nsew")
+    root.update()
+
+    cropper = ModelCrop(photo_full)
+    cropper.decode()
+    cropper.reset_image(*widget_size)
+    # zoom in, so that the crop fills the widget
+    cropper.zoom_image("in", steps=4)
+    frame.update_image(cropper.image_res)
+    root.update()
+
+    t_view = 0
+    step = 10
+    start = timer()
+    for i in range(num_frames):
+        # back and forth, to stay inside the photo
+        if i % 40 == 20:
+            step = -step
+        cropper.move_image(step, 0, preview=True)
+        start_view = timer()
+        frame.update_image(cropper.image_res)
+        root.update()
+        t_view += timer() - start_view
+    t_total = timer() - start
+
+    frame.destroy()
+    return t_total / num_frames, t_view / num_frames
+
+
+def bench_display(args):
+    """Compare the label and canvas display_backend of FrameCrop
+
+    The view time is converting the crop for Tk and drawing it
+    """
+    root = tk.Tk()
+    root.geometry(f"{args.widget_size[0]}x{args.widget_size[1]}")
+    root.grid_rowconfigure(0, weight=1)
+    root.grid_columnconfigure(0, weight=1)
+
+    with TemporaryDirectory() as synth_folder:
+        generate_synthetic(synth_folder, 1, args.synth_size)
+        photo_full = join(synth_folder, "synth_0000.jpg")
+
+        print(f"{'backend':>8} {'fps':>7} {'frame':>9} {'view':>9}")
+        for display_backend in ("label", "canvas"):
+            t_frame, t_view = time_drag(
+                root, photo_full, args.widget_size, display_backend, args.num_frames
+            )
+            recap = f"{display_backend:>8} {1 / t_frame:7.1f}"
+            recap += f" {t_frame * 1000:7.1f}ms {t_view * 1000:7.1f}ms"
+            print(recap)
+
+    root.destroy()
+
+
+def main():
+    args = parse_arguments()
+    setup_logger(args.log_level_debug)
+
+    if args.bench == "thumb":
+        bench_thumb(args)
+    elif args.bench == "crop":
+        bench_crop(args)
+    elif args.bench == "double":
+        bench_double(args)
+    elif args.bench == "display":
+        bench_display(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+import logging
+
+import numpy as np
+
+
+class BurstIndex:
+    """Group the photos in bursts, shots taken close in time by the same camera
+
+    For each camera the shots are sorted by capture time, and a new burst
+    starts where the gap from the previous shot is larger than max_gap
+    seconds, so the bursts are found with a single pass on the sorted times.
+    When photos are added only the cameras that got new shots are scanned
+    again, when the bursts are next needed.
+
+    Photos without a capture time are alone in their burst.
+    """
+
+    def __init__(self, max_gap=2.0):
+        logg = logging.getLogger(f"c.{__class__.__name__}.init")
+        logg.info("Start init")
+
+        self.max_gap = max_gap
+
+        # {photo_full: camera} of all the photos added
+        self._camera = {}
+        # {camera: {photo_full: capture time}}
+        self._shots = {}
+        # {photo_full: burst} all the photos of a burst share the same list
+        self._burst = {}
+        # {camera: [burst]}
+        self._camera_bursts = {}
+        # cameras with new shots, to scan again
+        self._stale = set()
+
+    def add(self, photo_full, date, camera):
+        """Add the photo, date is the capture time in seconds, nan if missing"""
+        self.discard(photo_full)
+        self._camera[photo_full] = camera
+        if np.isnan(date):
+            return
+        self._shots.setdefault(camera, {})[photo_full] = date
+        self._stale.add(camera)
+
+    def discard(self, photo_full):
+        """Forget the photo"""
+        camera = self._camera.pop(photo_full, None)
+        shots = self._shots.get(camera, {})
+        if photo_full in shots:
+            del shots[photo_full]
+            self._stale.add(camera)
+
+    def rename(self, photo_full, new_photo_full):
+        """Move the photo to the new name, in the same burst"""
+        if photo_full not in self._camera:
+            return
+        camera = self._camera[photo_full]
+        date = self._shots.get(camera, {}).get(photo_full, np.nan)
+        self.add(new_photo_full, date, camera)
+        self.discard(photo_full)
+
+    def __contains__(self, photo_full):
+        return photo_full in self._camera
+
+    def get_burst(self, photo_full):
+        """The photos in the same burst as photo_full, itself included, by time"""
+        self._update()
+        return self._burst.get(photo_full, [photo_full])
+
+    def _update(self):
+        """Scan again the cameras that changed"""
+        for camera in self._stale:
+            self._scan_camera(camera)
+        self._stale = set()
+
+    def _scan_camera(self, camera):
+        """Split the shots of the camera where the gap is larger than max_gap"""
+        logg = logging.getLogger(f"c.{__class__.__name__}._scan_camera")
+
+        # drop the old bursts of the camera
+        for burst in self._camera_bursts.pop(camera, []):
+            for photo_full in burst:
+                if self._burst.get(photo_full) is burst:
+                    del self._burst[photo_full]
+
+        shots = self._shots.get(camera, {})
+        if len(shots) == 0:
+            self._shots.pop(camera, None)
+            return
+
+        photos = list(shots)
+        times = np.fromiter(shots.values(), dtype=float, count=len(photos))
+        order = np.argsort(times, kind="stable")
+        # one pass on the sorted times: a burst starts after each large gap
+        starts = np.flatnonzero(np.diff(times[order]) > self.max_gap) + 1
+        bursts = []
+        for burst_order in np.split(order, starts):
+            burst = [photos[i] for i in burst_order]
+            for photo_full in burst:
+                self._burst[photo_full] = burst
+            bursts.append(burst)
+        self._camera_bursts[camera] = bursts
+        logg.debug(f"Found {len(bursts)} bursts in {len(photos)} shots of '{camera}'")
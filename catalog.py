@@ -0,0 +1,238 @@
+from os import makedirs
+from os.path import dirname
+import json
+import logging
+import sqlite3
+
+
+class Catalog:
+    """Persistent info on the photos, in a SQLite database
+
+    Keeps what is slow to rebuild at every launch:
+    - the listing of each input folder, with the mtime of its subfolders
+    - size and mtime of each photo, its dimensions and the parsed EXIF
+    - the digest of the content, for the photos that were hashed
+    - the selection state
+
+    Dimensions and metadata are valid only as long as size and mtime of the
+    photo match, the caller is expected to revalidate the listings.
+    Not safe to use from several threads, keep it in the main one.
+    """
+
+    _version = 2
+    # paths looked up in a single query, below the limit of SQL variables
+    _chunk_size = 500
+
+    _schema = """
+        CREATE TABLE IF NOT EXISTS roots (
+            folder TEXT PRIMARY KEY,
+            recursive INTEGER NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS folders (
+            folder TEXT NOT NULL,
+            sub_folder TEXT NOT NULL,
+            mtime_ns INTEGER,
+            PRIMARY KEY (folder, sub_folder)
+        );
+        CREATE TABLE IF NOT EXISTS listing (
+            folder TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            path TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            PRIMARY KEY (folder, position)
+        );
+        CREATE TABLE IF NOT EXISTS photos (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            width INTEGER NOT NULL,
+            height INTEGER NOT NULL,
+            metadata TEXT,
+            digest TEXT
+        );
+        CREATE TABLE IF NOT EXISTS selection (
+            path TEXT PRIMARY KEY,
+            selected INTEGER NOT NULL
+        );
+    """
+
+    def __init__(self, db_file):
+        logg = logging.getLogger(f"c.{__class__.__name__}.init")
+        logg.info(f"Start init in '{db_file}'")
+
+        self.db_file = db_file
+        db_folder = dirname(self.db_file)
+        if db_folder != "":
+            makedirs(db_folder, exist_ok=True)
+
+        self._conn = sqlite3.connect(self.db_file)
+        # the catalog can always be rebuilt, trade durability for speed
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != self._version:
+            logg.info(f"Catalog version {version}, creating a new one")
+            self._drop_tables()
+        self._conn.executescript(self._schema)
+        self._conn.execute(f"PRAGMA user_version={self._version}")
+        self._conn.commit()
+
+    def load_folder(self, folder, recursive):
+        """Return the saved listing of the folder
+
+        Returns ({sub_folder: mtime_ns}, [(photo_full, size, mtime_ns)]), or
+        None if the folder was never saved or was scanned with another recursive
+        """
+        row = self._conn.execute(
+            "SELECT recursive FROM roots WHERE folder = ?", (folder,)
+        ).fetchone()
+        if row is None or bool(row[0]) != recursive:
+            return None
+
+        folder_mtime = dict(
+            self._conn.execute(
+                "SELECT sub_folder, mtime_ns FROM folders WHERE folder = ?", (folder,)
+            )
+        )
+        photos = self._conn.execute(
+            "SELECT path, size, mtime_ns FROM listing WHERE folder = ? ORDER BY position",
+            (folder,),
+        ).fetchall()
+        return folder_mtime, photos
+
+    def save_folder(self, folder, recursive, folder_mtime, photos):
+        """Replace the listing of the folder
+
+        photos is a list of (photo_full, size, mtime_ns)
+        """
+        logg = logging.getLogger(f"c.{__class__.__name__}.save_folder")
+        logg.info(f"Saving {len(photos)} photos in '{folder}'")
+
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO roots VALUES (?, ?)", (folder, int(recursive))
+            )
+            self._conn.execute("DELETE FROM folders WHERE folder = ?", (folder,))
+            self._conn.executemany(
+                "INSERT INTO folders VALUES (?, ?, ?)",
+                ((folder, sub, mtime) for sub, mtime in folder_mtime.items()),
+            )
+            self._conn.execute("DELETE FROM listing WHERE folder = ?", (folder,))
+            self._conn.executemany(
+                "INSERT INTO listing VALUES (?, ?, ?, ?, ?)",
+                ((folder, pos, *photo) for pos, photo in enumerate(photos)),
+            )
+
+    def get_photos(self, photo_keys):
+        """Return the saved info of the photos that did not change
+
+        photo_keys is a list of (photo_full, size, mtime_ns)
+
+        Returns {photo_full: (width, height, metadata)}, metadata is None if
+        never parsed
+        """
+        stat_keys = {p: (s, m) for p, s, m in photo_keys}
+        found = {}
+        rows = self._select_photos("width, height, metadata", stat_keys)
+        for photo_full, size, mtime_ns, width, height, metadata in rows:
+            if stat_keys[photo_full] != (size, mtime_ns):
+                continue
+            metadata = None if metadata is None else json.loads(metadata)
+            found[photo_full] = (width, height, metadata)
+        return found
+
+    def put_photos(self, photo_infos):
+        """Save the dimensions of the photos
+
+        photo_infos is a list of (photo_full, size, mtime_ns, width, height),
+        the metadata and digest saved before are dropped
+        """
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO photos VALUES (?, ?, ?, ?, ?, NULL, NULL)",
+                photo_infos,
+            )
+
+    def put_metadata(self, photo_full, metadata):
+        """Save the metadata of the photo, the values are stored as strings"""
+        # exifread tags are not serializable, save them as they are shown
+        metadata_json = json.dumps(metadata, default=str)
+        with self._conn:
+            self._conn.execute(
+                "UPDATE photos SET metadata = ? WHERE path = ?",
+                (metadata_json, photo_full),
+            )
+
+    def get_digests(self, photo_keys):
+        """Return {photo_full: digest} of the photos hashed that did not change
+
+        photo_keys is a list of (photo_full, size, mtime_ns)
+        """
+        stat_keys = {p: (s, m) for p, s, m in photo_keys}
+        found = {}
+        for photo_full, size, mtime_ns, digest in self._select_photos(
+            "digest", stat_keys
+        ):
+            if digest is not None and stat_keys[photo_full] == (size, mtime_ns):
+                found[photo_full] = digest
+        return found
+
+    def _select_photos(self, columns, photo_fulls):
+        """Yield (path, size, mtime_ns, *columns) of the photos saved
+
+        The paths are looked up _chunk_size at a time with IN, instead of a
+        query per photo
+        """
+        photo_fulls = list(photo_fulls)
+        for start in range(0, len(photo_fulls), self._chunk_size):
+            chunk = photo_fulls[start : start + self._chunk_size]
+            marks = ", ".join("?" * len(chunk))
+            yield from self._conn.execute(
+                f"SELECT path, size, mtime_ns, {columns} FROM photos"
+                f" WHERE path IN ({marks})",
+                chunk,
+            )
+
+    def put_digests(self, digests):
+        """Save the digests, a list of (photo_full, size, mtime_ns, digest)"""
+        with self._conn:
+            self._conn.executemany(
+                "UPDATE photos SET digest = ?"
+                " WHERE path = ? AND size = ? AND mtime_ns = ?",
+                ((d, p, s, m) for p, s, m, d in digests),
+            )
+
+    def get_selection(self):
+        """Return the saved selection as {photo_full: is_selected}"""
+        rows = self._conn.execute("SELECT path, selected FROM selection")
+        return {path: bool(selected) for path, selected in rows}
+
+    def put_selection(self, selection):
+        """Save the selection state, selection is {photo_full: is_selected}"""
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO selection VALUES (?, ?)",
+                ((p, int(s)) for p, s in selection.items()),
+            )
+
+    def rename_photo(self, photo_full, new_photo_full):
+        """Move the info on a renamed photo to the new name"""
+        with self._conn:
+            for table in ("photos", "selection"):
+                self._conn.execute(
+                    f"DELETE FROM {table} WHERE path = ?", (new_photo_full,)
+                )
+                self._conn.execute(
+                    f"UPDATE {table} SET path = ? WHERE path = ?",
+                    (new_photo_full, photo_full),
+                )
+
+    def close(self):
+        self._conn.close()
+
+    def _drop_tables(self):
+        with self._conn:
+            for table in ("roots", "folders", "listing", "photos", "selection"):
+                self._conn.execute(f"DROP TABLE IF EXISTS {table}")
@@ -0,0 +1,153 @@
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import logging
+
+
+def hash_file(photo_full, chunk_size=2 ** 20):
+    """Digest of the content of the file, read in chunks to bound the memory"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(photo_full, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DuplicateFinder:
+    """Find the photos that are byte identical
+
+    Two files can be identical only if they have the same size, so the photos
+    are bucketed by size and only the ones that share a bucket are read. The
+    content is hashed in a thread, the results are collected with collect.
+
+    The digests are cached by (path, size, mtime_ns): a photo discarded and
+    added again unchanged, e.g. after a rescan, is not read a second time.
+    """
+
+    def __init__(self, num_workers=2):
+        logg = logging.getLogger(f"c.{__class__.__name__}.init")
+        logg.info("Start init")
+
+        self.num_workers = num_workers
+
+        # {photo_full: (size, mtime_ns)} of the photos tracked
+        self._stat_keys = {}
+        # {size: set of photo_full}
+        self._size_photos = {}
+        # {photo_full: (size, mtime_ns, digest)} also for the photos discarded
+        self._digests = {}
+        # {photo_full: (size, mtime_ns, Future)} of the hashes being computed
+        self._jobs = {}
+
+        # the pool is created when first needed
+        self._executor = None
+
+    def add(self, photo_full, size, mtime_ns):
+        """Track the photo, hash it if another photo has the same size"""
+        old_key = self._stat_keys.get(photo_full)
+        if old_key == (size, mtime_ns):
+            return
+        if old_key is not None:
+            self.discard(photo_full)
+
+        self._stat_keys[photo_full] = (size, mtime_ns)
+        same_size = self._size_photos.setdefault(size, set())
+        same_size.add(photo_full)
+        if len(same_size) > 1:
+            for other_full in same_size:
+                self._submit(other_full)
+
+    def set_digest(self, photo_full, size, mtime_ns, digest):
+        """Use a digest computed elsewhere, e.g. saved in the catalog"""
+        self._digests[photo_full] = (size, mtime_ns, digest)
+
+    def discard(self, photo_full):
+        """Stop tracking the photo, its digest stays cached"""
+        stat_key = self._stat_keys.pop(photo_full, None)
+        if stat_key is None:
+            return
+        same_size = self._size_photos[stat_key[0]]
+        same_size.discard(photo_full)
+        if len(same_size) == 0:
+            del self._size_photos[stat_key[0]]
+        job = self._jobs.pop(photo_full, None)
+        if job is not None:
+            job[2].cancel()
+
+    def rename(self, photo_full, new_photo_full):
+        """Move the photo and its digest to the new name"""
+        stat_key = self._stat_keys.get(photo_full)
+        cached = self._digests.pop(photo_full, None)
+        self.discard(photo_full)
+        if cached is not None:
+            self._digests[new_photo_full] = cached
+        if stat_key is not None:
+            self.add(new_photo_full, *stat_key)
+
+    def collect(self):
+        """Save the digests computed since the last call
+
+        Returns [(photo_full, size, mtime_ns, digest)] of the new digests
+        """
+        logg = logging.getLogger(f"c.{__class__.__name__}.collect")
+
+        new_digests = []
+        for photo_full in list(self._jobs):
+            size, mtime_ns, future = self._jobs[photo_full]
+            if not future.done():
+                continue
+            del self._jobs[photo_full]
+            try:
+                digest = future.result()
+            except OSError as e:
+                logg.warn(f"Failed to hash '{photo_full}': {e}")
+                continue
+            self._digests[photo_full] = (size, mtime_ns, digest)
+            new_digests.append((photo_full, size, mtime_ns, digest))
+        return new_digests
+
+    def pending(self):
+        """Number of photos still being hashed"""
+        return len(self._jobs)
+
+    def get_digest(self, photo_full):
+        """Digest of the photo, None if no other photo has its size or not done yet"""
+        stat_key = self._stat_keys.get(photo_full)
+        if stat_key is None or len(self._size_photos[stat_key[0]]) < 2:
+            return None
+        cached = self._digests.get(photo_full)
+        if cached is None or cached[:2] != stat_key:
+            return None
+        return cached[2]
+
+    def collapse(self, photo_list):
+        """Keep only the first photo of each group of identical ones, in order"""
+        seen = set()
+        unique = []
+        for photo_full in photo_list:
+            digest = self.get_digest(photo_full)
+            if digest is not None:
+                if digest in seen:
+                    continue
+                seen.add(digest)
+            unique.append(photo_full)
+        return unique
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+
+    def _submit(self, photo_full):
+        """Start hashing the photo, if the digest is not known yet"""
+        stat_key = self._stat_keys[photo_full]
+        cached = self._digests.get(photo_full)
+        if cached is not None and cached[:2] == stat_key:
+            return
+        if photo_full in self._jobs:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.num_workers)
+        future = self._executor.submit(hash_file, photo_full)
+        self._jobs[photo_full] = (*stat_key, future)
@@ -4,12 +4,17 @@ from tkinter import filedialog  # noqa: F401
 import tkinter as tk
 
 from model import Model
+from render_scheduler import RenderScheduler
 from utils import format_color
 from view import View
 
 
 class Controller:
-    def __init__(self, input_folder):
+    def __init__(self, input_folder, display_backend="label", **model_kwargs):
+        """model_kwargs are the settings passed to Model
+
+        display_backend is the widget that shows the photos, canvas or label
+        """
         logg = logging.getLogger(f"c.{__class__.__name__}.init")
         #  logg.setLevel("TRACE")
         logg.info("Start init")
@@ -18,7 +23,9 @@ class Controller:
         self.root.winfo_toplevel().title("Photo Viewer")
         self._fullscreen_state = False
 
-        self.model = Model()
+        self.model = Model(**model_kwargs)
+        # the mouse and resize events are applied at most once per frame
+        self.scheduler = RenderScheduler(self.root, self.model)
 
         # register callbacks on the model observables
         self.model.output_folder.addCallback(self.updatedOutputFolder)
@@ -32,7 +39,7 @@ class Controller:
         self.model.metadata_prim.addCallback(self.updatedMetadataPrim)
         self.model.metadata_echo.addCallback(self.updatedMetadataEcho)
 
-        self.view = View(self.root)
+        self.view = View(self.root, display_backend)
 
         # bind callbacks from user input
         # general keypress
@@ -102,6 +109,21 @@ class Controller:
         self.model.setLayout(2)
         self.model.setIndexPrim(0)
 
+        # keep adding the photos found in the input folders
+        self._ingest_id = None
+        self._ingest_delay = 1
+        # hash the thumbnails to find near duplicates, while they are decoded
+        self._hash_id = None
+        self._hash_delay = 100
+        # refine the previews drawn while the image moves, once idle
+        self._refine_id = None
+        self._refine_delay = 150
+        self.scheduleIngest()
+
+        # apply the changes in the input folders every so often
+        self._folder_events_delay = 500
+        self.root.after(self._folder_events_delay, self.pollFolderEvents)
+
     def run(self):
         """Start the app and run the mainloop"""
         logg = logging.getLogger(f"c.{__class__.__name__}.run")
@@ -109,6 +131,59 @@ class Controller:
 
         self.root.mainloop()
 
+        self.model.close()
+
+    def pollFolderEvents(self):
+        """Apply the changes in the input folders, the events are batched"""
+        logg = logging.getLogger(f"c.{__class__.__name__}.pollFolderEvents")
+        #  logg.setLevel("TRACE")
+        logg.trace("Polling folder events")
+        if self.model.applyFolderEvents():
+            # the new photos that did not fit in the step are loaded later
+            self.scheduleIngest()
+            self.scheduleHashing()
+        self.root.after(self._folder_events_delay, self.pollFolderEvents)
+
+    def scheduleIngest(self):
+        """Start pumping the folder scans, if not already running"""
+        if self._ingest_id is None:
+            self._ingest_id = self.root.after(self._ingest_delay, self.pumpIngest)
+
+    def pumpIngest(self):
+        """Add a slice of the photos found, until the scans are done
+
+        Each step is short, so that the UI stays responsive in between
+        """
+        logg = logging.getLogger(f"c.{__class__.__name__}.pumpIngest")
+        #  logg.setLevel("TRACE")
+        logg.trace("Pumping ingest")
+        self._ingest_id = None
+        if self.model.ingestStep():
+            self.scheduleIngest()
+        self.scheduleHashing()
+
+    def scheduleHashing(self):
+        """Start hashing the new thumbnails, if not already running"""
+        if self._hash_id is None:
+            self._hash_id = self.root.after(self._hash_delay, self.pumpHashing)
+
+    def pumpHashing(self):
+        """Hash a slice of the thumbnails, until they are all done"""
+        self._hash_id = None
+        if self.model.hashStep():
+            self.scheduleHashing()
+
+    def scheduleRefine(self):
+        """Refine the crops when the input is idle, dropping the older request"""
+        if self._refine_id is not None:
+            self.root.after_cancel(self._refine_id)
+        self._refine_id = self.root.after(self._refine_delay, self.pumpRefine)
+
+    def pumpRefine(self):
+        """Render the previews again with the slow resampling"""
+        self._refine_id = None
+        self.model.refineCrops()
+
     def KeyReleased(self, event):
         """Bind Key to functions
 
@@ -123,6 +198,21 @@ class Controller:
             self.model.swapDoubleLayout()
         elif keysym == "F5":
             self.model.cycleLayout()
+        elif keysym == "F6":
+            self.model.rescanInputFolders()
+            self.scheduleIngest()
+        elif keysym == "F7":
+            self.model.cycleSortKey()
+            self.scheduleIngest()
+        elif keysym == "F8":
+            self.model.reverseSort()
+            self.scheduleIngest()
+        elif keysym == "F9":
+            self.model.toggleFilter()
+            self.scheduleIngest()
+        elif keysym == "F10":
+            self.model.toggleDuplicates()
+            self.scheduleIngest()
         elif keysym == "F11":
             self._toggle_fullscreen()
 
@@ -138,6 +228,26 @@ class Controller:
         elif keysym == "2" or keysym == "KP_0":
             self.model.moveIndexEcho("sync")
 
+        # change photo in the group of near duplicates
+        elif keysym == "Next":
+            self.model.moveInGroup("prim", "forward")
+        elif keysym == "Prior":
+            self.model.moveInGroup("prim", "backward")
+        elif keysym == "9":
+            self.model.moveInGroup("echo", "forward")
+        elif keysym == "7":
+            self.model.moveInGroup("echo", "backward")
+
+        # change photo in the burst
+        elif keysym == "b":
+            self.model.jumpBurst("forward")
+        elif keysym == "v":
+            self.model.jumpBurst("backward")
+        elif keysym == "6":
+            self.model.moveEchoInBurst("forward")
+        elif keysym == "4":
+            self.model.moveEchoInBurst("backward")
+
         # like
         elif keysym == "k" or keysym == "KP_3":
             self.model.likePressed("prim")
@@ -170,6 +280,10 @@ class Controller:
         elif keysym == "o":
             self.createEventMouse("down")
 
+        # the moves and zooms draw a preview
+        if keysym in ("d", "a", "w", "s", "r", "f"):
+            self.scheduleRefine()
+
     def setOutputFolder(self):
         logg = logging.getLogger(f"c.{__class__.__name__}.setOutputFolder")
         #  logg.setLevel("TRACE")
@@ -223,6 +337,7 @@ class Controller:
         )
 
         self.model.addInputFolder(input_folder_full)
+        self.scheduleIngest()
 
     def updatedInputFolder(self, data):
         logg = logging.getLogger(f"c.{__class__.__name__}.updatedInputFolder")
@@ -234,6 +349,7 @@ class Controller:
         logg.info("Toggled input folder")
         state = self.view.frame_path_info.input_frame.checkbtn_input_state
         self.model.toggleInputFolder(state)
+        self.scheduleIngest()
 
     def updatedCurrentLayout(self, lay_num):
         logg = logging.getLogger(f"c.{__class__.__name__}.updatedCurrentLayout")
@@ -280,7 +396,7 @@ class Controller:
         widget_wid = event.widget.winfo_width()
         widget_hei = event.widget.winfo_height()
         logg.trace(f"width {widget_wid} height {widget_hei}")
-        self.model.doResize(widget_wid, widget_hei)
+        self.scheduler.resize(widget_wid, widget_hei)
 
     def updatedCroppedPrim(self, data):
         logg = logging.getLogger(f"c.{__class__.__name__}.updatedCroppedPrim")
@@ -318,7 +434,8 @@ class Controller:
             direction = "out"
         else:
             logg.error(f"Unrecognized mouse event num {event.num} delta {event.delta}")
-        self.model.zoomImage(direction, event.x, event.y)
+        self.scheduler.zoom(direction, event.x, event.y)
+        self.scheduleRefine()
 
     def scrolledMouseImageFrame(self, event):
         logg = logging.getLogger(f"c.{__class__.__name__}.scrolledMouseImageFrame")
@@ -330,19 +447,21 @@ class Controller:
             direction = "out"
         else:
             logg.error(f"Unrecognized mouse event num {event.num} delta {event.delta}")
-        self.model.zoomImage(direction)
+        self.scheduler.zoom(direction)
+        self.scheduleRefine()
 
     def clickedImage(self, event):
         logg = logging.getLogger(f"c.{__class__.__name__}.clickedImage")
         #  logg.setLevel("TRACE")
         logg.info("Clicked mouse on image")
-        self.model.saveMousePos(event.x, event.y)
+        self.scheduler.press_mouse(event.x, event.y)
 
     def movedImageMouse(self, event):
         logg = logging.getLogger(f"c.{__class__.__name__}.movedImageMouse")
         #  logg.setLevel("TRACE")
         logg.trace("Moved mouse on image")
-        self.model.moveImageMouse(event.x, event.y)
+        self.scheduler.move_mouse(event.x, event.y)
+        self.scheduleRefine()
 
     def rightClickedFrameCropPrim(self, event):
         """Setup delayed callback for eventual doubleclick"""
@@ -0,0 +1,223 @@
+from os import scandir
+from os import stat
+import logging
+
+
+class FolderCache:
+    """Remember the photos in each input folder
+
+    The listing of a folder is done with scandir, keeping the size and mtime of
+    each photo. The scan is a generator that yields the photos in batches, so
+    the listing can be used while it grows. It only has to be redone when the
+    folder is stale: the mtime of the folder (or of a subfolder, if scanned
+    recursively) changed, meaning a file was added, removed or renamed.
+    """
+
+    def __init__(self, is_photo):
+        logg = logging.getLogger(f"c.{__class__.__name__}.init")
+        logg.info("Start init")
+
+        # function that tells if a full path is a photo to load
+        self._is_photo = is_photo
+
+        # {folder: {sub_folder: mtime_ns}} including the folder itself
+        self._folder_mtime = {}
+        # {folder: [photo_full]} in the order scandir returned them
+        self._folder_photos = {}
+        # {folder: token} of the scans in progress, their listing is partial
+        self._scanning = {}
+        # {photo_full: (size, mtime_ns)}
+        self._stat_keys = {}
+        # {photo_full: folder} the input folder that the photo was found in
+        self._photo_root = {}
+
+    def get_photos(self, folder):
+        """Return the list of photos in the folder, empty if not scanned
+
+        If a scan is in progress the list is partial
+        """
+        return self._folder_photos.get(folder, [])
+
+    def is_listed(self, folder):
+        """True if the folder is scanned or being scanned"""
+        return folder in self._folder_photos
+
+    def is_stale(self, folder):
+        """True if the folder changed on disk since the scan"""
+        logg = logging.getLogger(f"c.{__class__.__name__}.is_stale")
+        if folder in self._scanning or folder not in self._folder_mtime:
+            return False
+        for sub_folder, old_mtime in self._folder_mtime[folder].items():
+            try:
+                new_mtime = stat(sub_folder).st_mtime_ns
+            except OSError:
+                new_mtime = None
+            if new_mtime != old_mtime:
+                logg.debug(f"Folder '{sub_folder}' changed")
+                return True
+        return False
+
+    def get_stat_key(self, photo_full):
+        """Return (size, mtime_ns) of the photo from the listing, None if unknown"""
+        return self._stat_keys.get(photo_full)
+
+    def get_root(self, photo_full):
+        """Return the input folder where the photo was found, None if unknown"""
+        return self._photo_root.get(photo_full)
+
+    def get_folder_mtime(self, folder):
+        """Return {sub_folder: mtime_ns} recorded when the folder was scanned"""
+        return self._folder_mtime.get(folder, {})
+
+    def set_folder_mtime(self, folder, folder_mtime):
+        """Record new mtimes for the folder, when the listing is known up to date"""
+        self._folder_mtime[folder] = dict(folder_mtime)
+
+    def load_listing(self, folder, folder_mtime, photos):
+        """Use a listing saved elsewhere instead of scanning the folder
+
+        photos is a list of (photo_full, size, mtime_ns)
+        """
+        logg = logging.getLogger(f"c.{__class__.__name__}.load_listing")
+        logg.info(f"Loading {len(photos)} photos in '{folder}'")
+
+        self.forget(folder)
+        self._folder_photos[folder] = []
+        self._folder_mtime[folder] = dict(folder_mtime)
+        for photo_full, size, mtime_ns in photos:
+            if photo_full in self._stat_keys:
+                # already listed in another folder
+                continue
+            self._folder_photos[folder].append(photo_full)
+            self._stat_keys[photo_full] = (size, mtime_ns)
+            self._photo_root[photo_full] = folder
+
+    def forget(self, folder):
+        """Drop the listing of the folder"""
+        for photo_full in self._folder_photos.pop(folder, []):
+            self._stat_keys.pop(photo_full, None)
+            self._photo_root.pop(photo_full, None)
+        self._folder_mtime.pop(folder, None)
+        self._scanning.pop(folder, None)
+
+    def scan_folder(self, folder, recursive=False, batch_size=64, max_batch=4096):
+        """Generator that lists the photos in the folder, saving their stat info
+
+        Yields lists of new photos, the first batches are small so that the
+        first photos are available quickly, then they grow up to max_batch.
+        If the generator is closed before the end, the listing is dropped.
+        """
+        logg = logging.getLogger(f"c.{__class__.__name__}.scan_folder")
+        logg.info(f"Scanning '{folder}' recursive {recursive}")
+
+        # drop the old entries, some files might be gone
+        self.forget(folder)
+        self._folder_photos[folder] = []
+        self._folder_mtime[folder] = {}
+        # a newer scan of the same folder might replace this one
+        scan_token = object()
+        self._scanning[folder] = scan_token
+
+        completed = False
+        try:
+            batch = []
+            to_scan = [folder]
+            while len(to_scan) > 0:
+                sub_folder = to_scan.pop()
+                for entry in self._scan_entries(folder, sub_folder, recursive):
+                    if entry.path in self._stat_keys:
+                        # already added by someone else
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        to_scan.append(entry.path)
+                        continue
+                    try:
+                        st = entry.stat()
+                    except OSError as e:
+                        logg.warn(f"Failed to stat '{entry.path}': {e}")
+                        continue
+                    self._folder_photos[folder].append(entry.path)
+                    self._stat_keys[entry.path] = (st.st_size, st.st_mtime_ns)
+                    self._photo_root[entry.path] = folder
+                    batch.append(entry.path)
+
+                    if len(batch) >= batch_size:
+                        yield batch
+                        batch = []
+                        batch_size = min(batch_size * 2, max_batch)
+            completed = True
+            yield batch
+        finally:
+            if self._scanning.get(folder) is not scan_token:
+                # replaced or forgotten, the listing is not ours anymore
+                pass
+            elif completed:
+                del self._scanning[folder]
+                found = len(self._folder_photos[folder])
+                logg.info(f"Found {found} photos in '{folder}'")
+            else:
+                logg.info(f"Scan of '{folder}' cancelled")
+                self.forget(folder)
+
+    def _scan_entries(self, folder, sub_folder, recursive):
+        """Generator of the interesting entries in sub_folder
+
+        Photos that are regular files, and folders if recursive
+        """
+        logg = logging.getLogger(f"c.{__class__.__name__}._scan_entries")
+        try:
+            # take the mtime before listing, a change during the scan will
+            # make the folder stale
+            self._folder_mtime[folder][sub_folder] = stat(sub_folder).st_mtime_ns
+            with scandir(sub_folder) as it:
+                for entry in it:
+                    try:
+                        if recursive and entry.is_dir(follow_symlinks=False):
+                            yield entry
+                        elif self._is_photo(entry.path) and entry.is_file():
+                            yield entry
+                    except OSError as e:
+                        logg.warn(f"Failed to check '{entry.path}': {e}")
+        except OSError as e:
+            logg.warn(f"Failed to scan '{sub_folder}': {e}")
+            self._folder_mtime[folder][sub_folder] = None
+
+    def add_photo(self, folder, photo_full):
+        """Add a new photo to the listing, or refresh its stat info
+
+        Returns False if the folder is not listed or the photo can't be read
+        """
+        logg = logging.getLogger(f"c.{__class__.__name__}.add_photo")
+        if folder not in self._folder_photos:
+            return False
+        try:
+            st = stat(photo_full)
+        except OSError as e:
+            # it might already be gone again
+            logg.debug(f"Failed to stat '{photo_full}': {e}")
+            return False
+        if photo_full not in self._stat_keys:
+            self._folder_photos[folder].append(photo_full)
+            self._photo_root[photo_full] = folder
+        self._stat_keys[photo_full] = (st.st_size, st.st_mtime_ns)
+        return True
+
+    def remove_photo(self, folder, photo_full):
+        """Drop the photo from the listing"""
+        if photo_full not in self._stat_keys:
+            return
+        del self._stat_keys[photo_full]
+        del self._photo_root[photo_full]
+        self._folder_photos[folder].remove(photo_full)
+
+    def rename_photo(self, folder, photo_full, new_photo_full):
+        """Change the name of the photo in the listing, keeping its position"""
+        if photo_full not in self._stat_keys:
+            self.add_photo(folder, new_photo_full)
+            return
+        # replacing an existing photo
+        self.remove_photo(folder, new_photo_full)
+        self._stat_keys[new_photo_full] = self._stat_keys.pop(photo_full)
+        self._photo_root[new_photo_full] = self._photo_root.pop(photo_full)
+        folder_photos = self._folder_photos[folder]
+        folder_photos[folder_photos.index(photo_full)] = new_photo_full
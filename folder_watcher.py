@@ -0,0 +1,300 @@
+from abc import ABC
+from abc import abstractmethod
+from os import scandir
+from os import stat
+from os.path import join
+from queue import Empty
+from queue import Queue
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import threading
+
+
+def make_folder_watcher(is_photo, poll_interval=2.0):
+    """Return an InotifyWatcher on Linux, a PollingWatcher elsewhere"""
+    logg = logging.getLogger("c.make_folder_watcher")
+
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(is_photo)
+        except OSError as e:
+            logg.warn(f"inotify not available, polling the folders: {e}")
+
+    return PollingWatcher(is_photo, poll_interval)
+
+
+class FolderWatcher(ABC):
+    """Basic interface for a FolderWatcher
+
+    Watches the photos in a set of folders (not recursively) from a background
+    thread, the events are collected in a queue and returned in batches by
+    get_events, as tuples (kind, photo_full, new_photo_full):
+    - ("add", photo_full, None): a new photo, or an existing one was rewritten
+    - ("remove", photo_full, None)
+    - ("rename", photo_full, new_photo_full)
+    """
+
+    def __init__(self, is_photo):
+        # function that tells if a full path is a photo to watch
+        self._is_photo = is_photo
+        self._events = Queue()
+
+    @abstractmethod
+    def add_folder(self, folder):
+        """Start watching the photos in the folder"""
+
+    @abstractmethod
+    def remove_folder(self, folder):
+        """Stop watching the folder, ignore it if not watched"""
+
+    def get_events(self):
+        """Return all the events collected since the last call"""
+        events = []
+        while True:
+            try:
+                events.append(self._events.get_nowait())
+            except Empty:
+                return events
+
+    @abstractmethod
+    def close(self):
+        """Stop the background thread"""
+
+    def _put_event(self, kind, photo_full, new_photo_full=None):
+        logg = logging.getLogger(f"c.{__class__.__name__}._put_event")
+        #  logg.setLevel("TRACE")
+
+        # a rename is interesting as long as one of the names is a photo
+        if kind == "rename":
+            old_is_photo = self._is_photo(photo_full)
+            new_is_photo = self._is_photo(new_photo_full)
+            if old_is_photo and not new_is_photo:
+                kind, new_photo_full = "remove", None
+            elif new_is_photo and not old_is_photo:
+                kind, photo_full, new_photo_full = "add", new_photo_full, None
+            elif not old_is_photo and not new_is_photo:
+                return
+        elif not self._is_photo(photo_full):
+            return
+
+        logg.trace(f"Event {kind} '{photo_full}' '{new_photo_full}'")
+        self._events.put((kind, photo_full, new_photo_full))
+
+
+class InotifyWatcher(FolderWatcher):
+    """Watch the folders with inotify, through ctypes"""
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_CLOEXEC = 0o2000000
+
+    # wd, mask, cookie, len
+    _event_header = struct.Struct("iIII")
+
+    def __init__(self, is_photo):
+        logg = logging.getLogger(f"c.{__class__.__name__}.init")
+        logg.info("Start init")
+
+        super().__init__(is_photo)
+
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = self._libc.inotify_init1(self.IN_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+        self._mask = (
+            self.IN_CLOSE_WRITE
+            | self.IN_MOVED_FROM
+            | self.IN_MOVED_TO
+            | self.IN_DELETE
+            | self.IN_DELETE_SELF
+            | self.IN_MOVE_SELF
+        )
+
+        # {wd: folder} and {folder: wd}
+        self._wd_folder = {}
+        self._folder_wd = {}
+        self._lock = threading.Lock()
+
+        # pipe to wake up the reader thread when closing
+        self._wake_r, self._wake_w = os.pipe()
+        self._thread = threading.Thread(target=self._read_loop, daemon=True)
+        self._thread.start()
+
+    def add_folder(self, folder):
+        logg = logging.getLogger(f"c.{__class__.__name__}.add_folder")
+        logg.info(f"Watching '{folder}'")
+
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(folder), self._mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            logg.warn(f"Failed to watch '{folder}': {os.strerror(errno)}")
+            return
+        with self._lock:
+            self._wd_folder[wd] = folder
+            self._folder_wd[folder] = wd
+
+    def remove_folder(self, folder):
+        with self._lock:
+            wd = self._folder_wd.pop(folder, None)
+            if wd is None:
+                return
+            del self._wd_folder[wd]
+        self._libc.inotify_rm_watch(self._fd, wd)
+
+    def close(self):
+        os.write(self._wake_w, b"x")
+        self._thread.join()
+        os.close(self._fd)
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+
+    def _read_loop(self):
+        """Read the events until woken up by close"""
+        logg = logging.getLogger(f"c.{__class__.__name__}._read_loop")
+        while True:
+            readable, _, _ = select.select([self._fd, self._wake_r], [], [])
+            if self._wake_r in readable:
+                return
+            try:
+                buf = os.read(self._fd, 64 * 1024)
+            except OSError as e:
+                logg.warn(f"Failed to read inotify events: {e}")
+                return
+            self._parse_events(buf)
+
+    def _parse_events(self, buf):
+        """Translate a buffer of inotify events in FolderWatcher events
+
+        The two halves of a rename share a cookie and are (almost always) in
+        the same read; a lonely half is a move in or out of the folder
+        """
+        logg = logging.getLogger(f"c.{__class__.__name__}._parse_events")
+        #  logg.setLevel("TRACE")
+
+        # {cookie: photo_full} of the IN_MOVED_FROM waiting for the IN_MOVED_TO
+        moved_from = {}
+
+        offset = 0
+        while offset + self._event_header.size <= len(buf):
+            wd, mask, cookie, name_len = self._event_header.unpack_from(buf, offset)
+            offset += self._event_header.size
+            name = buf[offset : offset + name_len].rstrip(b"\0")
+            offset += name_len
+
+            with self._lock:
+                folder = self._wd_folder.get(wd)
+            if folder is None:
+                continue
+
+            if mask & (self.IN_DELETE_SELF | self.IN_MOVE_SELF | self.IN_IGNORED):
+                logg.warn(f"Folder '{folder}' is gone, not watching it anymore")
+                with self._lock:
+                    self._wd_folder.pop(wd, None)
+                    self._folder_wd.pop(folder, None)
+                continue
+            if mask & self.IN_ISDIR:
+                continue
+
+            photo_full = join(folder, os.fsdecode(name))
+            logg.trace(f"mask {mask:#x} cookie {cookie} '{photo_full}'")
+
+            if mask & self.IN_MOVED_FROM:
+                moved_from[cookie] = photo_full
+            elif mask & self.IN_MOVED_TO:
+                if cookie in moved_from:
+                    self._put_event("rename", moved_from.pop(cookie), photo_full)
+                else:
+                    self._put_event("add", photo_full)
+            elif mask & self.IN_CLOSE_WRITE:
+                self._put_event("add", photo_full)
+            elif mask & self.IN_DELETE:
+                self._put_event("remove", photo_full)
+
+        # moved out of the watched folders
+        for photo_full in moved_from.values():
+            self._put_event("remove", photo_full)
+
+
+class PollingWatcher(FolderWatcher):
+    """Watch the folders checking their mtime every poll_interval seconds
+
+    Renames are reported as a remove and an add
+    """
+
+    def __init__(self, is_photo, poll_interval=2.0):
+        logg = logging.getLogger(f"c.{__class__.__name__}.init")
+        logg.info("Start init")
+
+        super().__init__(is_photo)
+        self.poll_interval = poll_interval
+
+        # {folder: (folder mtime_ns, set of photos)}
+        self._folders = {}
+        self._lock = threading.Lock()
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._poll_loop, daemon=True)
+        self._thread.start()
+
+    def add_folder(self, folder):
+        logg = logging.getLogger(f"c.{__class__.__name__}.add_folder")
+        logg.info(f"Watching '{folder}'")
+        state = self._scan_folder(folder)
+        with self._lock:
+            self._folders[folder] = state
+
+    def remove_folder(self, folder):
+        with self._lock:
+            self._folders.pop(folder, None)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _poll_loop(self):
+        while not self._stop.wait(self.poll_interval):
+            with self._lock:
+                folders = dict(self._folders)
+            for folder, (old_mtime, old_photos) in folders.items():
+                try:
+                    new_mtime = stat(folder).st_mtime_ns
+                except OSError:
+                    continue
+                if new_mtime == old_mtime:
+                    continue
+
+                new_mtime, new_photos = self._scan_folder(folder)
+                for photo_full in old_photos - new_photos:
+                    self._put_event("remove", photo_full)
+                for photo_full in new_photos - old_photos:
+                    self._put_event("add", photo_full)
+
+                with self._lock:
+                    # skip it if it was removed in the meantime
+                    if folder in self._folders:
+                        self._folders[folder] = (new_mtime, new_photos)
+
+    def _scan_folder(self, folder):
+        """Return (folder mtime_ns, set of photos)"""
+        logg = logging.getLogger(f"c.{__class__.__name__}._scan_folder")
+        try:
+            folder_mtime = stat(folder).st_mtime_ns
+            with scandir(folder) as it:
+                photos = {e.path for e in it if self._is_photo(e.path)}
+        except OSError as e:
+            logg.warn(f"Failed to scan '{folder}': {e}")
+            return None, set()
+        return folder_mtime, photos
@@ -1,10 +1,12 @@
 from os.path import abspath
 from os.path import dirname
+from os.path import expanduser
 from os.path import join
 import argparse
 import logging
 
 from controller import Controller
+from thumb_cache import ThumbCache
 
 
 def parse_arguments():
@@ -19,6 +21,138 @@ def parse_arguments():
         help="Path to starting folder",
     )
 
+    parser.add_argument(
+        "-r",
+        "--recursive",
+        action="store_true",
+        help="Also look for photos in the subfolders of the input folder, and"
+        " watch them; subfolders created later are watched after a rescan (F6)",
+    )
+
+    parser.add_argument(
+        "-c",
+        "--catalog",
+        type=str,
+        default="",
+        help="SQLite file to save the info on the photos, empty string to disable it",
+    )
+
+    parser.add_argument(
+        "-s",
+        "--sort_key",
+        type=str,
+        default="folder",
+        help="Order of the photos, F7 cycles through them and F8 reverses it",
+        choices=[
+            "folder",
+            "date",
+            "camera",
+            "iso",
+            "exposure",
+            "aperture",
+            "pixels",
+            "size",
+            "name",
+        ],
+    )
+
+    parser.add_argument(
+        "-f",
+        "--filter",
+        type=str,
+        default="",
+        help="Show only the matching photos, e.g. 'iso>=3200; camera=Canon EOS 40D;"
+        " day=2021-06-12', F9 toggles it",
+    )
+
+    parser.add_argument(
+        "-ndh",
+        "--near_dup_hash",
+        type=str,
+        default="dhash",
+        help="Perceptual hash used to find near duplicates",
+        choices=["dhash", "phash"],
+    )
+
+    parser.add_argument(
+        "-kd",
+        "--keep_duplicates",
+        action="store_true",
+        help="Show all the identical copies of a photo, F10 toggles it",
+    )
+
+    parser.add_argument(
+        "-bg",
+        "--burst_gap",
+        type=float,
+        default=2.0,
+        help="Seconds between two shots of the same burst, b/v jump between bursts",
+    )
+
+    parser.add_argument(
+        "-ccm",
+        "--cropper_cache_mb",
+        type=int,
+        default=1024,
+        help="Maximum memory of the decoded photos kept loaded, in MB",
+    )
+
+    parser.add_argument(
+        "-rcm",
+        "--render_cache_mb",
+        type=int,
+        default=256,
+        help="Size in MB of the cache of the crops shown recently",
+    )
+
+    parser.add_argument(
+        "-db",
+        "--display_backend",
+        type=str,
+        default="label",
+        help="Widget that shows the photos, canvas updates the image in place",
+        choices=["canvas", "label"],
+    )
+
+    parser.add_argument(
+        "-tw",
+        "--thumb_workers",
+        type=int,
+        default=None,
+        help="Number of processes that load the thumbnails, default one per core",
+    )
+
+    parser.add_argument(
+        "-tm",
+        "--thumb_mode",
+        type=str,
+        default="draft",
+        help="How to decode the pics for the thumbnails",
+        choices=["full", "draft", "exif"],
+    )
+
+    parser.add_argument(
+        "-tc",
+        "--thumb_cache",
+        type=str,
+        default=join(expanduser("~"), ".cache", "photo_viewer"),
+        help="Folder for the thumbnail cache, empty string to disable it",
+    )
+
+    parser.add_argument(
+        "-tcm",
+        "--thumb_cache_mb",
+        type=int,
+        default=256,
+        help="Maximum size of the thumbnail cache in MB",
+    )
+
+    parser.add_argument(
+        "--compact_thumb_cache",
+        action="store_true",
+        help="Compact the thumbnail cache, dropping missing pics, and exit",
+    )
+
     parser.add_argument(
         "-lld",
         "--log_level_debug",
@@ -120,29 +254,95 @@ def addLoggingLevel(levelName, levelNum, methodName=None):
     setattr(logging, methodName, logToRoot)
 
 
-def test_run(input_folder):
-    c = Controller(input_folder)
+def test_run(input_folder, display_backend="label", **model_kwargs):
+    c = Controller(input_folder, display_backend, **model_kwargs)
     c.run()
 
 
+def compact_thumb_cache(thumb_cache_dir, thumb_cache_mb):
+    thumb_cache = ThumbCache(thumb_cache_dir, max_bytes=thumb_cache_mb * 2 ** 20)
+    thumb_cache.compact(drop_missing=True)
+    thumb_cache.close()
+
+
 def main():
     args = parse_arguments()
 
     path_input = args.path_input
+    recursive = args.recursive
+    catalog_file = args.catalog
+    sort_key = args.sort_key
+    filter_query = args.filter
+    near_dup_hash = args.near_dup_hash
+    keep_duplicates = args.keep_duplicates
+    burst_gap = args.burst_gap
+    cropper_cache_mb = args.cropper_cache_mb
+    render_cache_mb = args.render_cache_mb
+    display_backend = args.display_backend
+    thumb_workers = args.thumb_workers
+    thumb_cache_dir = args.thumb_cache
+    thumb_cache_mb = args.thumb_cache_mb
+    thumb_mode = args.thumb_mode
     log_level_debug = args.log_level_debug
 
     setup_logger(log_level_debug)
 
     recap = "Startup settings: python3 photo_main.py"
     recap += f" --path_input {path_input}"
+    if recursive:
+        recap += " --recursive"
+    if catalog_file != "":
+        recap += f" --catalog {catalog_file}"
+    recap += f" --sort_key {sort_key}"
+    if filter_query != "":
+        recap += f' --filter "{filter_query}"'
+    recap += f" --near_dup_hash {near_dup_hash}"
+    if keep_duplicates:
+        recap += " --keep_duplicates"
+    recap += f" --burst_gap {burst_gap}"
+    recap += f" --cropper_cache_mb {cropper_cache_mb}"
+    recap += f" --render_cache_mb {render_cache_mb}"
+    recap += f" --display_backend {display_backend}"
+    recap += f" --thumb_workers {thumb_workers}"
+    recap += f" --thumb_cache {thumb_cache_dir}"
+    recap += f" --thumb_cache_mb {thumb_cache_mb}"
+    recap += f" --thumb_mode {thumb_mode}"
     recap += f" --log_level_debug {log_level_debug}"
 
     logmain = logging.getLogger("UI")
     logmain.info(recap)
 
+    if thumb_cache_dir == "":
+        thumb_cache_dir = None
+    if catalog_file == "":
+        catalog_file = None
+
+    if args.compact_thumb_cache:
+        if thumb_cache_dir is None:
+            logmain.error("The thumbnail cache is disabled, nothing to compact")
+        else:
+            compact_thumb_cache(thumb_cache_dir, thumb_cache_mb)
+        return
+
     dir_file = abspath(dirname(__file__))
     input_folder = join(dir_file, path_input)
-    test_run(input_folder)
+    test_run(
+        input_folder,
+        thumb_workers=thumb_workers,
+        thumb_cache_dir=thumb_cache_dir,
+        thumb_cache_mb=thumb_cache_mb,
+        thumb_mode=thumb_mode,
+        recursive_input=recursive,
+        catalog_file=catalog_file,
+        sort_key=sort_key,
+        filter_query=filter_query,
+        near_dup_hash=near_dup_hash,
+        collapse_duplicates=not keep_duplicates,
+        burst_gap=burst_gap,
+        cropper_cache_mb=cropper_cache_mb,
+        render_cache_mb=render_cache_mb,
+        display_backend=display_backend,
+    )
 
 
 if __name__ == "__main__":
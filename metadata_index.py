@@ -0,0 +1,301 @@
+from datetime import datetime
+from fractions import Fraction
+from os.path import basename
+import logging
+import re
+
+import numpy as np
+
+
+def parse_number(value):
+    """Parse an EXIF value like 200, 1/200, 28/5 or [100, 0], nan if not valid"""
+    if value is None:
+        return np.nan
+    # multiple values, keep the first
+    value = str(value).strip("[] ").split(",")[0]
+    try:
+        return float(Fraction(value))
+    except (ValueError, ZeroDivisionError):
+        return np.nan
+
+
+def parse_datetime(value):
+    """Parse an EXIF date as '2021:06:12 14:03:22', in seconds, nan if not valid"""
+    if value is None:
+        return np.nan
+    try:
+        date = datetime.strptime(str(value).strip(), "%Y:%m:%d %H:%M:%S")
+    except ValueError:
+        return np.nan
+    # naive times, the zone of the camera is not known anyway
+    return (date - datetime(1970, 1, 1)).total_seconds()
+
+
+def parse_date_value(value):
+    """Parse a date given by the user, as 2021-06-12 or 2021:06:12 14:03:22"""
+    value = value.strip().replace("-", ":")
+    if " " not in value:
+        value += " 00:00:00"
+    return parse_datetime(value)
+
+
+def parse_query(query):
+    """Parse a query like 'iso>=3200; camera=Canon EOS 40D; day=2021-06-12'
+
+    Clauses are separated by ';', each is field op value with op one of
+    =, >=, <=; numeric fields become (low, high) ranges with None for an open
+    end, two clauses on the same field are merged, text fields are matched
+    exactly (ignoring case)
+
+    Returns {field: condition}, raises ValueError if the query is not valid
+    """
+    conditions = {}
+    for clause in query.split(";"):
+        if clause.strip() == "":
+            continue
+        match = re.fullmatch(r"\s*(\w+)\s*(>=|<=|=)\s*(.+?)\s*", clause)
+        if match is None:
+            raise ValueError(f"Invalid filter clause '{clause}'")
+        field, op, value = match.groups()
+        field = field.lower()
+
+        if field in MetadataIndex.text_fields:
+            if op != "=":
+                raise ValueError(f"Only = is valid for field '{field}'")
+            if field == "day":
+                value = value.replace(":", "-")
+            conditions[field] = value
+            continue
+        if field not in MetadataIndex.numeric_fields:
+            raise ValueError(f"Unknown field '{field}'")
+
+        number = parse_date_value(value) if field == "date" else parse_number(value)
+        if np.isnan(number):
+            raise ValueError(f"Invalid value '{value}' for field '{field}'")
+        low, high = conditions.get(field, (None, None))
+        if op in ("=", ">="):
+            low = number
+        if op in ("=", "<="):
+            high = number
+        conditions[field] = (low, high)
+
+    return conditions
+
+
+def natural_key(name):
+    """Key to sort names with numbers as humans do: img2 before img10"""
+    return [int(s) if s.isdigit() else s.lower() for s in re.split(r"(\d+)", name)]
+
+
+class MetadataIndex:
+    """Compact arrays of the metadata of the photos, to sort and filter them
+
+    The fields are extracted once per photo with add, each field is then a
+    numpy array with a row per photo (nan where missing). The text fields are
+    kept as strings, and turned in an array of ranks when first needed, so
+    that sorting on any field is a single argsort.
+
+    To filter, each numeric field gets a sorted copy of its values (ranges are
+    two binary searches) and each text field a {value: rows} map; they are
+    built when first needed and dropped when the rows change.
+    """
+
+    # fields that are numbers
+    numeric_fields = (
+        "date",
+        "iso",
+        "exposure",
+        "aperture",
+        "width",
+        "height",
+        "pixels",
+        "size",
+    )
+    # fields that are strings, and the key to sort them
+    text_fields = {
+        "camera": str.lower,
+        "make": str.lower,
+        "day": str,
+        "name": natural_key,
+    }
+
+    def __init__(self, capacity=1024):
+        logg = logging.getLogger(f"c.{__class__.__name__}.init")
+        logg.info("Start init")
+
+        # {photo_full: row}
+        self._row = {}
+        self._num = {f: np.full(capacity, np.nan) for f in self.numeric_fields}
+        self._text = {f: [] for f in self.text_fields}
+        # {field: ranks of the strings} dropped when the rows change
+        self._text_rank = {}
+        # {field: (rows sorted by value, sorted values)} for the range queries
+        self._sorted = {}
+        # {field: {lowercase value: [rows]}} for the equality queries
+        self._text_rows = {}
+
+    @staticmethod
+    def extract_fields(photo_full, metadata, size):
+        """Build the fields of a photo from the metadata of PhotoInfo"""
+        # fall back to the date of the last change if the original is missing
+        date_str = metadata.get("EXIF DateTimeOriginal", metadata.get("Image DateTime"))
+        date = parse_datetime(date_str)
+        # as 2021-06-12
+        day = "" if np.isnan(date) else str(date_str).strip()[:10].replace(":", "-")
+        width = parse_number(metadata.get("PILWidth"))
+        height = parse_number(metadata.get("PILHeight"))
+        return {
+            "date": date,
+            "iso": parse_number(metadata.get("EXIF ISOSpeedRatings")),
+            "exposure": parse_number(metadata.get("EXIF ExposureTime")),
+            "aperture": parse_number(metadata.get("EXIF FNumber")),
+            "width": width,
+            "height": height,
+            "pixels": width * height,
+            "size": np.nan if size is None else size,
+            "camera": str(metadata.get("Image Model", "")).strip(),
+            "make": str(metadata.get("Image Make", "")).strip(),
+            "day": day,
+            "name": basename(photo_full),
+        }
+
+    def add(self, photo_full, fields):
+        """Save the fields of the photo, replacing the old ones if present"""
+        row = self._row.get(photo_full)
+        if row is None:
+            # discarded rows are not reused
+            row = len(self._text["name"])
+            self._row[photo_full] = row
+            if row == len(self._num["date"]):
+                self._grow()
+            for field in self.text_fields:
+                self._text[field].append(fields[field])
+        else:
+            for field in self.text_fields:
+                self._text[field][row] = fields[field]
+        for field in self.numeric_fields:
+            self._num[field][row] = fields[field]
+        self._drop_derived()
+
+    def rename(self, photo_full, new_photo_full):
+        """Move the row of the photo to the new name"""
+        row = self._row.pop(photo_full, None)
+        if row is None:
+            return
+        self._row[new_photo_full] = row
+        self._text["name"][row] = basename(new_photo_full)
+        self._drop_derived()
+
+    def discard(self, photo_full):
+        """Forget the fields of the photo, e.g. when it was rewritten"""
+        # the row is left unused, it is not worth compacting the arrays
+        self._row.pop(photo_full, None)
+
+    def __contains__(self, photo_full):
+        return photo_full in self._row
+
+    def sort(self, photo_list, field, reverse=False):
+        """Return the photos sorted on field, the missing values go last
+
+        The sort is stable, photos with the same value keep their order
+        """
+        logg = logging.getLogger(f"c.{__class__.__name__}.sort")
+        logg.info(f"Sorting {len(photo_list)} photos on {field} reverse {reverse}")
+
+        rows = self.get_rows(photo_list)
+        keys = self.get_keys(field)[rows]
+        if reverse:
+            # nan stays nan, so missing values still go last
+            keys = -keys
+        order = np.argsort(keys, kind="stable")
+        return [photo_list[i] for i in order]
+
+    def select(self, photo_list, conditions):
+        """Return the photos that match all the conditions, in the same order
+
+        conditions is {field: condition} as returned by parse_query
+        """
+        logg = logging.getLogger(f"c.{__class__.__name__}.select")
+        logg.info(f"Filtering {len(photo_list)} photos on {conditions}")
+
+        match = np.ones(len(self._text["name"]), dtype=bool)
+        for field, condition in conditions.items():
+            if field in self.text_fields:
+                match &= self._match_text(field, condition)
+            else:
+                match &= self._match_range(field, *condition)
+
+        keep = match[self.get_rows(photo_list)]
+        return [p for p, k in zip(photo_list, keep) if k]
+
+    def _match_range(self, field, low, high):
+        """Mask of the rows with low <= value <= high, None is an open end"""
+        if field not in self._sorted:
+            values = self._num[field][: len(self._text["name"])]
+            # nan are sorted last, so they never match
+            order = np.argsort(values, kind="stable")
+            self._sorted[field] = (order, values[order])
+        order, sorted_values = self._sorted[field]
+
+        start = 0 if low is None else np.searchsorted(sorted_values, low, "left")
+        if high is None:
+            high = np.inf
+        end = np.searchsorted(sorted_values, high, "right")
+
+        match = np.zeros(len(order), dtype=bool)
+        match[order[start:end]] = True
+        return match
+
+    def _match_text(self, field, value):
+        """Mask of the rows where the field is value, ignoring case"""
+        if field not in self._text_rows:
+            text_rows = {}
+            for row, text in enumerate(self._text[field]):
+                text_rows.setdefault(text.lower(), []).append(row)
+            self._text_rows[field] = text_rows
+
+        match = np.zeros(len(self._text["name"]), dtype=bool)
+        match[self._text_rows[field].get(value.lower(), [])] = True
+        return match
+
+    def _drop_derived(self):
+        """The rows changed, the ranks and the query indexes are stale"""
+        self._text_rank = {}
+        self._sorted = {}
+        self._text_rows = {}
+
+    def get_value(self, photo_full, field):
+        """Value of field for the photo, that must be in the index"""
+        row = self._row[photo_full]
+        if field in self._num:
+            return self._num[field][row]
+        return self._text[field][row]
+
+    def get_rows(self, photo_list):
+        """Array of the rows of the photos, they must all be in the index"""
+        return np.fromiter(
+            (self._row[p] for p in photo_list), dtype=np.intp, count=len(photo_list)
+        )
+
+    def get_keys(self, field):
+        """Array of the sort keys of field for all the rows"""
+        if field in self._num:
+            return self._num[field]
+        if field not in self._text_rank:
+            self._text_rank[field] = self._rank_text(field)
+        return self._text_rank[field]
+
+    def _rank_text(self, field):
+        """Position of each string in the sorted unique strings, nan if empty"""
+        values = self._text[field]
+        unique = sorted(set(values), key=self.text_fields[field])
+        rank_of = {v: float(i) for i, v in enumerate(unique)}
+        rank_of[""] = np.nan
+        return np.fromiter((rank_of[v] for v in values), dtype=float, count=len(values))
+
+    def _grow(self):
+        """Double the capacity of the numeric arrays"""
+        for field in self.numeric_fields:
+            old = self._num[field]
+            self._num[field] = np.full(len(old) * 2, np.nan)
+            self._num[field][: len(old)] = old
@@ -1,27 +1,59 @@
+from concurrent.futures import ThreadPoolExecutor
 from fractions import Fraction
 from math import ceil
+from math import floor
 from math import log
 from math import sqrt
 from os import listdir
 from os import makedirs
 from os.path import basename
+from os.path import dirname
 from os.path import isdir
-from os.path import join
 from os.path import splitext
 from shutil import copy2
 from sys import getsizeof
+from timeit import default_timer as timer
 import logging
 
 from PIL import Image  # type: ignore
-from PIL import ImageTk
 
+from burst_index import BurstIndex
+from catalog import Catalog
+from content_hash import DuplicateFinder
+from folder_cache import FolderCache
+from folder_watcher import make_folder_watcher
+from metadata_index import MetadataIndex
+from metadata_index import parse_query
 from observable import Observable
+from photo_hash import NearDuplicateIndex
+from photo_hash import dhash
+from photo_hash import phash
+from photo_index import PhotoIndex
 from photo_info import PhotoInfo
+from render_cache import RenderCache
+from render_pool import RenderPool
+from thumb_cache import ThumbCache
+from thumb_loader import ThumbLoader
 from utils import format_color
 
 
 class Model:
-    def __init__(self):
+    def __init__(
+        self,
+        thumb_workers=None,
+        thumb_cache_dir=None,
+        thumb_cache_mb=256,
+        thumb_mode="draft",
+        recursive_input=False,
+        catalog_file=None,
+        sort_key="folder",
+        filter_query="",
+        near_dup_hash="dhash",
+        collapse_duplicates=True,
+        burst_gap=2.0,
+        cropper_cache_mb=1024,
+        render_cache_mb=256,
+    ):
         logg = logging.getLogger(f"c.{__class__.__name__}.init")
         logg.info("Start init")
 
@@ -36,6 +68,44 @@ class Model:
         # dict to send (selection_info, status) -> keep in de-selected one
         self.selection_list = Observable({})
 
+        # ordered full paths of the active photos, with O(1) lookup of the index
+        self._active_photo_list = PhotoIndex()
+        # fields of the metadata in compact arrays, used to sort the photos
+        self._metadata_index = MetadataIndex()
+        # order of the active photos, folder keeps the order of the listing
+        self._sort_keys = (
+            "folder",
+            "date",
+            "camera",
+            "iso",
+            "exposure",
+            "aperture",
+            "pixels",
+            "size",
+            "name",
+        )
+        self._sort_key = sort_key
+        self._sort_reverse = False
+        # {field: condition} the active photos must match, see parse_query
+        self._filter = {}
+        self._filter_enabled = True
+        if filter_query != "":
+            try:
+                self._filter = parse_query(filter_query)
+            except ValueError as e:
+                logging.getLogger("UI").warn(f"Ignoring filter: {e}")
+
+        # groups of photos with similar perceptual hash of the thumbnail
+        self._near_dup_index = NearDuplicateIndex()
+        self._near_dup_hash = {"dhash": dhash, "phash": phash}[near_dup_hash]
+        # photos to hash, when their thumbnail is ready
+        self._to_hash = []
+        # byte identical photos, only the first copy is active when collapsing
+        self._duplicate_finder = DuplicateFinder()
+        self._collapse_duplicates = collapse_duplicates
+        # shots of the same camera at most burst_gap seconds apart
+        self._burst_index = BurstIndex(burst_gap)
+
         # full path of the current_photo_prim
         self.current_photo_prim = Observable("")
         # index in self._active_photo_list of current photo
@@ -46,17 +116,72 @@ class Model:
 
         # set of valid photo extensions to load in _active_photo_list
         self._is_photo_ext = set((".jpg", ".jpeg", ".JPG", ".png"))
+        # listing of the photos in each input folder
+        self._folder_cache = FolderCache(self._is_photo)
+        # look for photos in the subfolders of the input folders
+        self._recursive_input = recursive_input
+        # {folder: scan generator} of the listings still growing
+        self._ingest_jobs = {}
+        # the PhotoInfo are created in chunks, for at most _load_max_time
+        # seconds per call, the photos left are loaded by ingestStep
+        self._load_chunk = 64
+        self._load_max_time = 0.1
+        self._load_pending = False
+        # photos that failed to open, not tried again until they change
+        self._failed_photos = set()
+        # the first sort or filter on the metadata waits for the MetadataIndex,
+        # that is built by ingestStep in slices of _load_max_time
+        self._index_pending = False
+        # persistent info on the photos, disabled if no file is given
+        if catalog_file is None:
+            self._catalog = None
+            self._stored_selection = {}
+        else:
+            self._catalog = Catalog(catalog_file)
+            self._stored_selection = self._catalog.get_selection()
+        # the listings loaded from the catalog are checked again in a thread
+        self._revalidate_executor = None
+        # {folder: Future} of the FolderCache with the listing on disk
+        self._revalidate_jobs = {}
+        # notice new/removed photos in the input folders, only the toggled
+        # ones are watched
+        self._folder_watcher = make_folder_watcher(self._is_photo)
+        self._watched_folders = set()
+        # {input folder: subfolders watched} when recursive_input
+        self._watched_sub_folders = {}
         # thumbnail size for ThumbButtons
         self._thumb_size = 50
+        # persistent store of thumbnails, disabled if no folder is given
+        if thumb_cache_dir is None:
+            thumb_cache = None
+        else:
+            thumb_cache = ThumbCache(
+                thumb_cache_dir, self._thumb_size, thumb_cache_mb * 2 ** 20
+            )
+        # pool of processes that load the thumbnails
+        self._thumb_loader = ThumbLoader(
+            self._thumb_size, thumb_workers, thumb_cache, thumb_mode
+        )
         # how much to move the image from keyboard
         self._mov_delta = 200
 
-        # ImageTk that holds the cropped picture
+        # PIL Image of the cropped picture, the view converts it for Tk
         self.cropped_prim = Observable(None)
         self.cropped_echo = Observable(None)
-        # cache dimension for the Holder
+        # cache dimension for the Holder, in number of photos and decoded bytes
         self._cropper_cache_dim = 10
-        self._loaded_croppers = Holder(self._cropper_cache_dim)
+        self._loaded_croppers = Holder(
+            self._cropper_cache_dim, cropper_cache_mb * 2 ** 20
+        )
+        # photos to decode in the background around prim and echo, more are
+        # taken in the direction of the last move
+        self._prefetch_ahead = 2
+        self._prefetch_behind = 1
+        self._prefetch_direction = 1
+        # the crops shown recently, to go back to them without resampling
+        self._render_cache = RenderCache(render_cache_mb * 2 ** 20)
+        # prim and echo are resampled at the same time
+        self._render_pool = RenderPool(render_cache=self._render_cache)
         self._widget_wid = -1
         self._widget_hei = -1
 
@@ -109,6 +234,8 @@ class Model:
         old_folders[input_folder_full] = True
         self.input_folders.set(old_folders)
 
+        self._watch_folder(input_folder_full)
+
         self.updatePhotoInfoList()
 
     def toggleInputFolder(self, state):
@@ -128,7 +255,62 @@ class Model:
             logui.warn("At least one input folder has to be selected.")
             self.input_folders._docallbacks()
 
-        self.updatePhotoInfoList()
+        # stop the scans and the watch of the folders toggled off, the scans
+        # will start again from scratch if toggled on; the listings of the
+        # folders toggled on again missed the changes, check them
+        input_folders = self.input_folders.get()
+        toggled_on = []
+        for folder in input_folders:
+            if input_folders[folder] is False:
+                self._cancel_ingest(folder)
+                self._unwatch_folder(folder)
+            elif folder not in self._watched_folders:
+                self._watch_folder(folder)
+                toggled_on.append(folder)
+
+        self.updatePhotoInfoList(revalidate=toggled_on)
+
+    def _watch_folder(self, folder):
+        """Start watching the input folder"""
+        self._folder_watcher.add_folder(folder)
+        self._watched_folders.add(folder)
+
+    def _unwatch_folder(self, folder):
+        """Stop watching the input folder, its events are not received anymore"""
+        if folder not in self._watched_folders:
+            return
+        self._folder_watcher.remove_folder(folder)
+        self._watched_folders.discard(folder)
+        for sub_folder in self._watched_sub_folders.pop(folder, ()):
+            self._folder_watcher.remove_folder(sub_folder)
+
+    def _watch_sub_folders(self, folder):
+        """Watch the subfolders found by the recursive scan of the input folder
+
+        Called when the listing is complete; the subfolders created later are
+        watched after the next rescan
+        """
+        if not self._recursive_input or folder not in self._watched_folders:
+            return
+        sub_folders = {
+            sub_folder
+            for sub_folder, mtime in self._folder_cache.get_folder_mtime(folder).items()
+            if sub_folder != folder and mtime is not None
+        }
+        watched = self._watched_sub_folders.get(folder, set())
+        for sub_folder in sub_folders - watched:
+            self._folder_watcher.add_folder(sub_folder)
+        for sub_folder in watched - sub_folders:
+            self._folder_watcher.remove_folder(sub_folder)
+        self._watched_sub_folders[folder] = sub_folders
+
+    def rescanInputFolders(self):
+        """Look for new or removed photos in the input folders"""
+        logg = logging.getLogger(f"c.{__class__.__name__}.rescanInputFolders")
+        logg.info("Rescanning input folders")
+
+        self._failed_photos.clear()
+        self.updatePhotoInfoList(revalidate=self.input_folders.get())
 
     def saveSelection(self):
         logg = logging.getLogger(f"c.{__class__.__name__}.saveSelection")
@@ -208,42 +390,983 @@ class Model:
             # also sync echo to prim
             self.moveIndexEcho("sync")
 
-    def updatePhotoInfoList(self):
+    def updatePhotoInfoList(self, revalidate=()):
         """Update photo_info_list_active, load new photos and relative info
 
+        The listing of the folders is cached, the folders in revalidate are
+        checked for changes on disk. A folder not listed yet is scanned in the
+        background: only the first batch of photos is read here, the rest is
+        added by ingestStep, that also creates the PhotoInfo that did not fit
+        in _load_max_time
+
         photo_info_list_active is actually a dict of PhotoInfo objects
-        Has to load the thumbnail and metadata
+        The new PhotoInfo only read the header of the pic, the thumbnails are
+        loaded in the background and the metadata when needed
         """
         logg = logging.getLogger(f"c.{__class__.__name__}.updatePhotoInfoList")
         #  logg.setLevel("TRACE")
         logg.info("Update photo_info_list_active")
 
+        input_folders = self.input_folders.get()
+        for folder in input_folders:
+            # the folder is not toggled, skip it
+            if input_folders[folder] is False:
+                continue
+            if folder in revalidate and self._folder_cache.is_stale(folder):
+                self._cancel_ingest(folder)
+                self._folder_cache.forget(folder)
+            if not self._folder_cache.is_listed(folder):
+                self._start_ingest(folder)
+
         # list of filenames of active photos: ideally parallel to
         # photo_info_list_active.keys() but dict order can't be trusted so we
         # keep track here of the index
-        # TODO the list passed to view to sort in special way
-        # TODO sort list according to metadata
-        # hopefully loading them will be fast, all will be needed to sort
-        self._active_photo_list = []
+        self._active_photo_list.set_photos(self._collect_active_photos())
 
+        self._load_pending = self._load_photo_infos(timer() + self._load_max_time)
+        self._order_active_list()
+        self._publish_active_list()
+
+        if len(self._active_photo_list) == 0:
+            logui = logging.getLogger("UI")
+            logui.warn("No photos in the active list.")
+            return
+
+        current_photo_prim = self.current_photo_prim.get()
+        if current_photo_prim in self._active_photo_list:
+            # the photo is still in list: if needed update the index
+            self._index_prim = self._active_photo_list.index(current_photo_prim)
+        else:
+            # the photo is not in list anymore: reset to 0
+            self._index_prim = 0
+            self._update_photo_prim(self._active_photo_list[0])
+
+        # reset the echo index to follow prim
+        self._index_echo = self._index_prim
+        # reload the echo image
+        self._update_photo_echo(self._active_photo_list[self._index_echo])
+
+    def ingestStep(self, max_time=0.1):
+        """Add to the active list the photos found by the scans in progress
+
+        Reads batches for at most max_time seconds, then updates the active
+        list once; prim and echo keep pointing at the same files
+
+        The PhotoInfo of the photos found are created within the same
+        max_time, if some are left no new batch is read until they are done
+
+        If a sort or filter is waiting for the metadata, they are read first,
+        and the active list is sorted once they are all in the MetadataIndex
+
+        Returns True if there are scans running or photos left to load
+        """
+        logg = logging.getLogger(f"c.{__class__.__name__}.ingestStep")
+        #  logg.setLevel("TRACE")
+
+        if (
+            len(self._ingest_jobs) == 0
+            and not self._load_pending
+            and not self._index_pending
+        ):
+            return False
+
+        start = timer()
+        if self._index_pending:
+            self._index_pending = self._index_metadata(
+                self._collect_loaded_photos(), start + max_time
+            )
+            if not self._index_pending:
+                self._apply_index()
+            return True
+
+        new_photos = 0
+        for folder in list(self._ingest_jobs):
+            while timer() - start < max_time and not self._load_pending:
+                try:
+                    batch = next(self._ingest_jobs[folder])
+                except StopIteration:
+                    del self._ingest_jobs[folder]
+                    self._save_listing(folder)
+                    self._watch_sub_folders(folder)
+                    break
+                new_photos += len(batch)
+        logg.trace(f"Found {new_photos} photos in {timer() - start:.3f}s")
+
+        if new_photos > 0 or self._load_pending:
+            old_prim = self.current_photo_prim.get()
+            old_echo = self.current_photo_echo.get()
+
+            # the listings only grow at the end, the order is preserved
+            self._active_photo_list.set_photos(self._collect_active_photos())
+            self._load_pending = self._load_photo_infos(start + max_time)
+            self._order_active_list()
+            self._publish_active_list()
+
+            if len(self._active_photo_list) > 0:
+                self._index_prim, prim_changed = self._track_photo(
+                    old_prim, self._index_prim, {}
+                )
+                if prim_changed:
+                    self._update_photo_prim(self._active_photo_list[self._index_prim])
+                self._index_echo, echo_changed = self._track_photo(
+                    old_echo, self._index_echo, {}
+                )
+                if echo_changed:
+                    self._update_photo_echo(self._active_photo_list[self._index_echo])
+
+        return len(self._ingest_jobs) > 0 or self._load_pending
+
+    def _collect_active_photos(self):
+        """Return the listed photos of the toggled folders, in folder order"""
+        active_photos = []
         input_folders = self.input_folders.get()
         for folder in input_folders:
-            # the folder is not toggled, skip it
             if input_folders[folder] is False:
                 continue
-            for photo in listdir(folder):
-                photo_full = join(folder, photo)
-                if self._is_photo(photo_full):
-                    self._active_photo_list.append(photo_full)
+            active_photos.extend(self._folder_cache.get_photos(folder))
+        return active_photos
 
-        new_photo_info_active = {}
+    def _start_ingest(self, folder):
+        """Start scanning the folder, read the first batch right away
+
+        If the listing is in the catalog use that, and check it in the background
+        """
+        logg = logging.getLogger(f"c.{__class__.__name__}._start_ingest")
+        logg.info(f"Start ingesting '{folder}'")
+
+        if self._catalog is not None:
+            saved = self._catalog.load_folder(folder, self._recursive_input)
+            if saved is not None:
+                self._folder_cache.load_listing(folder, *saved)
+                self._watch_sub_folders(folder)
+                if self._revalidate_executor is None:
+                    self._revalidate_executor = ThreadPoolExecutor(max_workers=1)
+                self._revalidate_jobs[folder] = self._revalidate_executor.submit(
+                    self._list_folder, folder
+                )
+                return
+
+        scan = self._folder_cache.scan_folder(folder, self._recursive_input)
+        try:
+            next(scan)
+        except StopIteration:
+            self._save_listing(folder)
+            self._watch_sub_folders(folder)
+            return
+        self._ingest_jobs[folder] = scan
+
+    def _list_folder(self, folder):
+        """Scan the folder in a separate FolderCache, runs in another thread"""
+        folder_cache = FolderCache(self._is_photo)
+        for _ in folder_cache.scan_folder(folder, self._recursive_input):
+            pass
+        return folder_cache
+
+    def _get_revalidate_events(self):
+        """Compare the listings loaded from the catalog with the ones on disk
+
+        Returns the differences as folder events, only for the checks done
+        """
+        logg = logging.getLogger(f"c.{__class__.__name__}._get_revalidate_events")
+
+        events = []
+        for folder in list(self._revalidate_jobs):
+            future = self._revalidate_jobs[folder]
+            if not future.done():
+                continue
+            del self._revalidate_jobs[folder]
+            # the folder was scanned again in the meantime
+            if not self._folder_cache.is_listed(folder) or folder in self._ingest_jobs:
+                continue
+
+            disk_cache = future.result()
+            disk_photos = disk_cache.get_photos(folder)
+            for photo_full in disk_photos:
+                old_key = self._folder_cache.get_stat_key(photo_full)
+                if old_key != disk_cache.get_stat_key(photo_full):
+                    events.append(("add", photo_full, None))
+            disk_set = set(disk_photos)
+            for photo_full in self._folder_cache.get_photos(folder):
+                if photo_full not in disk_set:
+                    events.append(("remove", photo_full, None))
+            self._folder_cache.set_folder_mtime(
+                folder, disk_cache.get_folder_mtime(folder)
+            )
+            logg.info(f"Revalidated '{folder}': {len(events)} changes so far")
+            self._watch_sub_folders(folder)
+
+            # save the new mtimes even if nothing changed
+            self._save_listing(folder)
+
+        return events
+
+    def _save_listing(self, folder):
+        """Save the listing of the folder in the catalog, if complete"""
+        if self._catalog is None:
+            return
+        if not self._folder_cache.is_listed(folder) or folder in self._ingest_jobs:
+            return
+        photos = []
+        for photo_full in self._folder_cache.get_photos(folder):
+            photos.append((photo_full, *self._folder_cache.get_stat_key(photo_full)))
+        self._catalog.save_folder(
+            folder,
+            self._recursive_input,
+            self._folder_cache.get_folder_mtime(folder),
+            photos,
+        )
+
+    def _cancel_ingest(self, folder):
+        """Stop the scan of the folder, its partial listing is dropped"""
+        scan = self._ingest_jobs.pop(folder, None)
+        if scan is not None:
+            logg = logging.getLogger(f"c.{__class__.__name__}._cancel_ingest")
+            logg.info(f"Cancel ingesting '{folder}'")
+            scan.close()
+
+    def applyFolderEvents(self):
+        """Apply the changes noticed by the watcher in the input folders
+
+        The events collected since the last call are applied as a batch: the
+        active list is updated in place, without scanning the folders again,
+        and prim/echo keep pointing at the same files if they are still there
+
+        Returns True if the active list changed
+        """
+        logg = logging.getLogger(f"c.{__class__.__name__}.applyFolderEvents")
+        #  logg.setLevel("TRACE")
+
+        events = self._folder_watcher.get_events()
+        events.extend(self._get_revalidate_events())
+        if len(events) == 0:
+            return False
+        logg.info(f"Applying {len(events)} folder events")
+
+        # update the listings, remember the folders touched
+        touched = set()
+        # {old_name: new_name}
+        renamed = {}
+        # photos added again, the old decoded image must not be shown
+        rewritten = set()
+        for kind, photo_full, new_photo_full in events:
+            logg.trace(f"{kind} '{photo_full}' '{new_photo_full}'")
+            folder = self._find_root(photo_full)
+            new_folder = (
+                None if new_photo_full is None else self._find_root(new_photo_full)
+            )
+            if folder is None and new_folder is None:
+                continue
+            touched.update(f for f in (folder, new_folder) if f is not None)
+            if kind == "add":
+                self._folder_cache.add_photo(folder, photo_full)
+                # the photo might have been rewritten, load it again
+                self._photo_info_list_all.pop(photo_full, None)
+                self._failed_photos.discard(photo_full)
+                self._metadata_index.discard(photo_full)
+                self._burst_index.discard(photo_full)
+                self._render_cache.discard_photo(photo_full)
+                self._loaded_croppers.discard(photo_full)
+                rewritten.add(photo_full)
+            elif kind == "remove":
+                self._folder_cache.remove_photo(folder, photo_full)
+                self._near_dup_index.discard(photo_full)
+                self._duplicate_finder.discard(photo_full)
+                self._burst_index.discard(photo_full)
+                self._render_cache.discard_photo(photo_full)
+                self._loaded_croppers.discard(photo_full)
+            elif kind == "rename":
+                if new_folder == folder:
+                    self._folder_cache.rename_photo(folder, photo_full, new_photo_full)
+                else:
+                    if folder is not None:
+                        self._folder_cache.remove_photo(folder, photo_full)
+                    if new_folder is not None:
+                        self._folder_cache.add_photo(new_folder, new_photo_full)
+                self._rename_photo(photo_full, new_photo_full)
+                # follow chains of renames
+                for old_name in renamed:
+                    if renamed[old_name] == photo_full:
+                        renamed[old_name] = new_photo_full
+                renamed[photo_full] = new_photo_full
+
+        for folder in touched:
+            self._save_listing(folder)
+
+        input_folders = self.input_folders.get()
+        touched = {f for f in touched if input_folders.get(f, False)}
+        if len(touched) == 0 and len(renamed) == 0:
+            return False
+
+        # the photos now in the touched folders
+        listed = set()
+        for folder in touched:
+            listed.update(self._folder_cache.get_photos(folder))
+
+        # rename and drop in place
+        new_active = []
         for photo_full in self._active_photo_list:
-            # load new photos in _photo_info_list_all
+            photo_full = renamed.get(photo_full, photo_full)
+            if self._find_root(photo_full) in touched and photo_full not in listed:
+                continue
+            new_active.append(photo_full)
+
+        # insert the new photos after the last one of the same folder
+        already_active = set(new_active)
+        for folder in touched:
+            to_add = [
+                p
+                for p in self._folder_cache.get_photos(folder)
+                if p not in already_active
+            ]
+            if len(to_add) == 0:
+                continue
+            last_pos = len(new_active)
+            for pos in range(len(new_active) - 1, -1, -1):
+                if self._folder_cache.get_root(new_active[pos]) == folder:
+                    last_pos = pos + 1
+                    break
+            new_active[last_pos:last_pos] = to_add
+        logg.trace(f"Active list {len(self._active_photo_list)} -> {len(new_active)}")
+
+        old_prim = self.current_photo_prim.get()
+        old_echo = self.current_photo_echo.get()
+
+        self._active_photo_list.set_photos(new_active)
+        self._load_pending = self._load_photo_infos(timer() + self._load_max_time)
+        self._order_active_list()
+        self._publish_active_list()
+
+        if len(self._active_photo_list) == 0:
+            logui = logging.getLogger("UI")
+            logui.warn("No photos left in the active list.")
+            return True
+
+        # keep prim and echo on the same files, show them again if rewritten
+        self._index_prim, prim_changed = self._track_photo(
+            old_prim, self._index_prim, renamed
+        )
+        if prim_changed or self._active_photo_list[self._index_prim] in rewritten:
+            self._update_photo_prim(self._active_photo_list[self._index_prim])
+        self._index_echo, echo_changed = self._track_photo(
+            old_echo, self._index_echo, renamed
+        )
+        if echo_changed or self._active_photo_list[self._index_echo] in rewritten:
+            self._update_photo_echo(self._active_photo_list[self._index_echo])
+
+        return True
+
+    def _track_photo(self, old_photo, old_index, renamed):
+        """Find the new index of a photo after the active list changed
+
+        If the photo is gone, stay at the same position
+
+        Returns (new_index, changed) where changed is True if the photo
+        shown has to be updated
+        """
+        new_photo = renamed.get(old_photo, old_photo)
+        new_index = self._active_photo_list.get_index(new_photo)
+        if new_index is not None and new_photo in self._photo_info_list_all:
+            return new_index, new_photo != old_photo
+        new_index = min(old_index, len(self._active_photo_list) - 1)
+        return new_index, True
+
+    def _find_root(self, photo_full):
+        """Return the input folder that the photo belongs to, None if not found"""
+        root = self._folder_cache.get_root(photo_full)
+        if root is not None:
+            return root
+        input_folders = self.input_folders.get()
+        folder = dirname(photo_full)
+        while folder not in input_folders:
+            if not self._recursive_input or dirname(folder) == folder:
+                return None
+            folder = dirname(folder)
+        return folder
+
+    def _rename_photo(self, photo_full, new_photo_full):
+        """Move the info on a renamed photo to the new name"""
+        photo_info = self._photo_info_list_all.pop(photo_full, None)
+        if photo_info is not None:
+            photo_info.photo_name_full = new_photo_full
+            self._photo_info_list_all[new_photo_full] = photo_info
+
+        selection_list = self.selection_list.get()
+        if photo_full in selection_list:
+            selection_list[new_photo_full] = selection_list.pop(photo_full)
+            self.selection_list.set(selection_list)
+
+        self._metadata_index.rename(photo_full, new_photo_full)
+        self._near_dup_index.rename(photo_full, new_photo_full)
+        self._duplicate_finder.rename(photo_full, new_photo_full)
+        self._burst_index.rename(photo_full, new_photo_full)
+        self._render_cache.discard_photo(photo_full)
+        self._loaded_croppers.discard(photo_full)
+
+        if self._catalog is not None:
+            self._catalog.rename_photo(photo_full, new_photo_full)
+
+    def _load_photo_infos(self, deadline=None):
+        """Create the PhotoInfo missing for the photos in the active list
+
+        Only the header is read, the thumbnails are produced in the background
+        The photos that fail to load are dropped from the active list
+
+        The photos are loaded in chunks until timer() passes deadline, at least
+        one chunk is loaded; the photos left out are dropped from the active
+        list too, until a later call loads them
+
+        Returns True if there are photos left to load
+        """
+        logg = logging.getLogger(f"c.{__class__.__name__}._load_photo_infos")
+
+        new_photo_list = [
+            p
+            for p in self._active_photo_list
+            if p not in self._photo_info_list_all and p not in self._failed_photos
+        ]
+
+        start = 0
+        while start < len(new_photo_list):
+            self._load_photo_chunk(new_photo_list[start : start + self._load_chunk])
+            start += self._load_chunk
+            if deadline is not None and timer() > deadline:
+                break
+        num_left = len(new_photo_list) - start
+        if num_left > 0:
+            logg.info(f"Loaded {start} photos, {num_left} left")
+
+        # drop the photos that failed or are left to load
+        if len(new_photo_list) > 0:
+            self._active_photo_list.set_photos(
+                p for p in self._active_photo_list if p in self._photo_info_list_all
+            )
+
+        return num_left > 0
+
+    def _load_photo_chunk(self, new_photo_list):
+        """Create the PhotoInfo of the photos, that are not loaded yet"""
+        logg = logging.getLogger(f"c.{__class__.__name__}._load_photo_chunk")
+
+        cached, missing = self._thumb_loader.lookup(
+            new_photo_list, self._folder_cache.get_stat_key
+        )
+
+        # dimensions and metadata saved in the catalog
+        photo_keys = []
+        for photo_full in new_photo_list:
+            stat_key = self._folder_cache.get_stat_key(photo_full)
+            if stat_key is not None:
+                photo_keys.append((photo_full, *stat_key))
+        if self._catalog is None:
+            catalogued = {}
+        else:
+            catalogued = self._catalog.get_photos(photo_keys)
+
+        for photo_full in cached:
+            self._photo_info_list_all[photo_full] = PhotoInfo(
+                photo_full, self._thumb_size, cached[photo_full]
+            )
+        for photo_full in missing:
+            # the header is needed only if the dimensions are not known
+            dimensions = None
+            if photo_full in catalogued:
+                dimensions = catalogued[photo_full][:2]
+            try:
+                # if the worker fails the thumbnail is decoded in the same way
+                photo_info = PhotoInfo(
+                    photo_full,
+                    self._thumb_size,
+                    thumb_mode=self._thumb_loader.thumb_mode,
+                    dimensions=dimensions,
+                )
+            except OSError as e:
+                logg.warn(f"Failed to open '{photo_full}': {e}")
+                self._failed_photos.add(photo_full)
+                continue
+            photo_info.set_thumb_future(self._thumb_loader.submit(photo_full))
+            self._photo_info_list_all[photo_full] = photo_info
+
+        # hash the new thumbnails in the background
+        self._to_hash.extend(
+            p for p in new_photo_list if p in self._photo_info_list_all
+        )
+
+        # look for identical copies, the files are read in the background
+        if self._catalog is None:
+            digests = {}
+        else:
+            digests = self._catalog.get_digests(photo_keys)
+        for photo_full, size, mtime_ns in photo_keys:
             if photo_full not in self._photo_info_list_all:
-                self._photo_info_list_all[photo_full] = PhotoInfo(
-                    photo_full, self._thumb_size
+                continue
+            if photo_full in digests:
+                self._duplicate_finder.set_digest(
+                    photo_full, size, mtime_ns, digests[photo_full]
+                )
+            self._duplicate_finder.add(photo_full, size, mtime_ns)
+
+        if self._catalog is not None:
+            self._update_catalog(photo_keys, catalogued)
+
+        # index the metadata now, so that it counts in the time of the chunk
+        if self._needs_metadata():
+            self._index_metadata(
+                [p for p in new_photo_list if p in self._photo_info_list_all]
+            )
+
+    def _update_catalog(self, photo_keys, catalogued):
+        """Sync the new PhotoInfo with the catalog
+
+        The metadata already parsed is set in the PhotoInfo, the dimensions of
+        the photos not catalogued are saved, the stored selection is restored
+        """
+        logg = logging.getLogger(f"c.{__class__.__name__}._update_catalog")
+
+        new_photo_infos = []
+        for photo_full, size, mtime_ns in photo_keys:
+            photo_info = self._photo_info_list_all.get(photo_full)
+            if photo_info is None:
+                continue
+            if photo_full in catalogued:
+                photo_info.metadata = catalogued[photo_full][2]
+            else:
+                new_photo_infos.append(
+                    (photo_full, size, mtime_ns, photo_info.width, photo_info.height)
                 )
+        logg.info(f"Found {len(catalogued)} in catalog, {len(new_photo_infos)} new")
+        self._catalog.put_photos(new_photo_infos)
 
+        selection_list = self.selection_list.get()
+        restored = False
+        for photo_full, _, _ in photo_keys:
+            if photo_full in selection_list or photo_full not in self._stored_selection:
+                continue
+            photo_info = self._photo_info_list_all.get(photo_full)
+            if photo_info is None:
+                continue
+            selection_list[photo_full] = [
+                photo_info,
+                self._stored_selection[photo_full],
+            ]
+            restored = True
+        if restored:
+            self.selection_list.set(selection_list)
+
+    def _save_selection(self):
+        """Save the selection state in the catalog"""
+        if self._catalog is None:
+            return
+        selection_list = self.selection_list.get()
+        selection = {p: selection_list[p][1] for p in selection_list}
+        self._stored_selection.update(selection)
+        self._catalog.put_selection(selection)
+
+    def _get_metadata(self, pic):
+        """Get the metadata of the pic, saving them in the catalog if new"""
+        photo_info = self._photo_info_list_all[pic]
+        if self._catalog is not None and photo_info.metadata is None:
+            self._catalog.put_metadata(pic, photo_info.get_metadata())
+        return photo_info.get_metadata()
+
+    def setSortKey(self, sort_key, reverse=False):
+        """Sort the active photos on sort_key, prim and echo stay on the same photo"""
+        logg = logging.getLogger(f"c.{__class__.__name__}.setSortKey")
+        logg.info(f"Setting sort_key to '{sort_key}' reverse {reverse}")
+
+        if sort_key not in self._sort_keys:
+            logg.error(f"Unrecognized sort_key {sort_key}")
+            return
+
+        logui = logging.getLogger("UI")
+        order = "descending" if reverse else "ascending"
+        logui.info(f"Sorting photos by {sort_key}, {order}")
+
+        self._sort_key = sort_key
+        self._sort_reverse = reverse
+        self._rebuild_active_list()
+
+    def cycleSortKey(self):
+        """Sort on the next key, ascending"""
+        next_key = self._sort_keys.index(self._sort_key) + 1
+        self.setSortKey(self._sort_keys[next_key % len(self._sort_keys)])
+
+    def reverseSort(self):
+        """Flip the order of the sort"""
+        self.setSortKey(self._sort_key, not self._sort_reverse)
+
+    def setFilter(self, query):
+        """Show only the photos that match the query, see parse_query
+
+        An empty query removes the filter; if no photo matches, the old filter
+        is kept
+        """
+        logg = logging.getLogger(f"c.{__class__.__name__}.setFilter")
+        logg.info(f"Setting filter to '{query}'")
+        logui = logging.getLogger("UI")
+
+        try:
+            new_filter = parse_query(query)
+        except ValueError as e:
+            logui.warn(f"Invalid filter: {e}")
+            return
+
+        old_filter = self._filter
+        old_enabled = self._filter_enabled
+        self._filter = new_filter
+        self._filter_enabled = True
+        if not self._rebuild_active_list():
+            logui.warn("No photos match the filter, keeping the old one.")
+            self._filter = old_filter
+            self._filter_enabled = old_enabled
+            self._rebuild_active_list()
+
+    def toggleFilter(self):
+        """Switch the current filter off and on"""
+        logg = logging.getLogger(f"c.{__class__.__name__}.toggleFilter")
+        logg.info("Toggling filter")
+        logui = logging.getLogger("UI")
+
+        if len(self._filter) == 0:
+            logui.info("No filter set.")
+            return
+        self._filter_enabled = not self._filter_enabled
+        if not self._rebuild_active_list():
+            logui.warn("No photos match the filter.")
+            self._filter_enabled = not self._filter_enabled
+            self._rebuild_active_list()
+        else:
+            state = "on" if self._filter_enabled else "off"
+            logui.info(f"Filter {self._filter} is {state}")
+
+    def _rebuild_active_list(self):
+        """Filter and sort again the loaded photos of the toggled folders
+
+        Only the listings and the MetadataIndex are used; prim and echo stay on
+        the same photos if they are still active
+
+        If the order needs metadata not indexed yet, they are read for at most
+        _load_max_time: if some are left the active list is not changed, and
+        ingestStep rebuilds it once they are all read
+
+        Returns False, without publishing, if the new active list is empty
+        """
+        logui = logging.getLogger("UI")
+
+        loaded_photos = self._collect_loaded_photos()
+        if self._needs_metadata() and self._index_metadata(
+            loaded_photos, timer() + self._load_max_time
+        ):
+            # keep the current order, ingestStep goes on reading the metadata
+            self._index_pending = True
+            logui.info("Reading the metadata, the list is updated when done.")
+            return True
+        self._index_pending = False
+
+        old_prim = self.current_photo_prim.get()
+        old_echo = self.current_photo_echo.get()
+
+        self._active_photo_list.set_photos(loaded_photos)
+        self._order_active_list()
+        if len(self._active_photo_list) == 0:
+            return False
+        self._publish_active_list()
+
+        self._index_prim, prim_changed = self._track_photo(
+            old_prim, self._index_prim, {}
+        )
+        if prim_changed:
+            self._update_photo_prim(self._active_photo_list[self._index_prim])
+        self._index_echo, echo_changed = self._track_photo(
+            old_echo, self._index_echo, {}
+        )
+        if echo_changed:
+            self._update_photo_echo(self._active_photo_list[self._index_echo])
+        return True
+
+    def _collect_loaded_photos(self):
+        """Return the photos of the toggled folders with a PhotoInfo"""
+        return [
+            p for p in self._collect_active_photos() if p in self._photo_info_list_all
+        ]
+
+    def _apply_index(self):
+        """Filter and sort the active list, now that the MetadataIndex is ready
+
+        The filter was accepted before its photos could be checked: if none
+        match it is turned off
+        """
+        if self._rebuild_active_list():
+            return
+        logui = logging.getLogger("UI")
+        logui.warn("No photos match the filter, turning it off.")
+        self._filter_enabled = False
+        self._rebuild_active_list()
+
+    def _order_active_list(self):
+        """Filter, sort and collapse the identical copies of the active photos
+
+        The first time a photo is filtered or sorted its metadata are read,
+        after that the work is done on the arrays in the MetadataIndex
+        """
+        use_filter = self._filter_enabled and len(self._filter) > 0
+        if self._needs_metadata():
+            self._index_metadata(self._active_photo_list)
+        if use_filter:
+            self._active_photo_list.set_photos(
+                self._metadata_index.select(list(self._active_photo_list), self._filter)
+            )
+        if self._sort_key != "folder":
+            self._active_photo_list.set_photos(
+                self._metadata_index.sort(
+                    list(self._active_photo_list), self._sort_key, self._sort_reverse
+                )
+            )
+        if self._collapse_duplicates:
+            # the first copy in the new order is kept
+            self._active_photo_list.set_photos(
+                self._duplicate_finder.collapse(self._active_photo_list)
+            )
+
+    def _needs_metadata(self):
+        """True if the active list is filtered or sorted on the metadata"""
+        # with folder order the active list is already in listing order
+        use_filter = self._filter_enabled and len(self._filter) > 0
+        return self._sort_key != "folder" or use_filter
+
+    def toggleDuplicates(self):
+        """Switch between hiding and showing the identical copies of the photos"""
+        logg = logging.getLogger(f"c.{__class__.__name__}.toggleDuplicates")
+        logg.info("Toggling duplicates")
+        logui = logging.getLogger("UI")
+
+        self._collapse_duplicates = not self._collapse_duplicates
+        state = "hidden" if self._collapse_duplicates else "shown"
+        logui.info(f"Identical copies of the photos are {state}.")
+        self._rebuild_active_list()
+
+    def _collect_digests(self):
+        """Save the digests computed in the background, collapse the new copies"""
+        logg = logging.getLogger(f"c.{__class__.__name__}._collect_digests")
+
+        new_digests = self._duplicate_finder.collect()
+        if len(new_digests) == 0:
+            return
+        logg.info(f"Collected {len(new_digests)} digests")
+        if self._catalog is not None:
+            self._catalog.put_digests(new_digests)
+
+        if not self._collapse_duplicates:
+            return
+        old_len = len(self._active_photo_list)
+        unique = self._duplicate_finder.collapse(self._active_photo_list)
+        if len(unique) == old_len:
+            return
+        self._rebuild_active_list()
+        logui = logging.getLogger("UI")
+        logui.info(f"Hiding {old_len - len(self._active_photo_list)} identical copies.")
+
+    def _index_metadata(self, photo_list, deadline=None):
+        """Add the photos missing in the MetadataIndex
+
+        The photos are read until timer() passes deadline, at least one is
+
+        Returns True if there are photos left to index
+        """
+        logg = logging.getLogger(f"c.{__class__.__name__}._index_metadata")
+
+        to_index = [p for p in photo_list if p not in self._metadata_index]
+        if len(to_index) == 0:
+            return False
+        logg.info(f"Indexing metadata of {len(to_index)} photos")
+
+        for num_done, photo_full in enumerate(to_index, start=1):
+            try:
+                metadata = self._get_metadata(photo_full)
+            except OSError as e:
+                logg.warn(f"Failed to read metadata of '{photo_full}': {e}")
+                photo_info = self._photo_info_list_all[photo_full]
+                metadata = {
+                    "PILWidth": photo_info.width,
+                    "PILHeight": photo_info.height,
+                }
+            stat_key = self._folder_cache.get_stat_key(photo_full)
+            size = None if stat_key is None else stat_key[0]
+            self._metadata_index.add(
+                photo_full, MetadataIndex.extract_fields(photo_full, metadata, size)
+            )
+            if deadline is not None and timer() > deadline:
+                break
+
+        num_left = len(to_index) - num_done
+        if num_left > 0:
+            logg.info(f"Indexed {num_done} photos, {num_left} left")
+        return num_left > 0
+
+    def hashStep(self, max_time=0.05):
+        """Hash the thumbnails that are ready, for at most max_time seconds
+
+        Also collect the digests of the content computed in the background
+
+        Returns True if there are photos still to hash
+        """
+        logg = logging.getLogger(f"c.{__class__.__name__}.hashStep")
+        #  logg.setLevel("TRACE")
+
+        self._collect_digests()
+        if len(self._to_hash) == 0:
+            return self._duplicate_finder.pending() > 0
+
+        start = timer()
+        waiting = []
+        hashed = 0
+        while len(self._to_hash) > 0 and timer() - start < max_time:
+            photo_full = self._to_hash.pop()
+            photo_info = self._photo_info_list_all.get(photo_full)
+            if photo_info is None:
+                # gone in the meantime
+                continue
+            if photo_info.thumb_is_pending():
+                waiting.append(photo_full)
+                continue
+            photo_hash = self._near_dup_hash(photo_info.thumb)
+            self._near_dup_index.add(photo_full, photo_hash)
+            hashed += 1
+        self._to_hash.extend(waiting)
+        logg.trace(f"Hashed {hashed}, {len(self._to_hash)} left")
+
+        return len(self._to_hash) > 0 or self._duplicate_finder.pending() > 0
+
+    def moveInGroup(self, which, direction):
+        """Move prim or echo to the next near duplicate of the current photo
+
+        The photos in the group are visited in the order of the active list
+        """
+        logg = logging.getLogger(f"c.{__class__.__name__}.moveInGroup")
+        logg.info(f"Moving {which} {direction} in group")
+        logui = logging.getLogger("UI")
+
+        if which == "echo" and self.layout_current.get() not in self._layout_is_double:
+            logg.warn("Current layout is not double, can't move index echo")
+            return
+
+        if which == "prim":
+            current_photo = self.current_photo_prim.get()
+        else:
+            current_photo = self.current_photo_echo.get()
+
+        group = [
+            p
+            for p in self._near_dup_index.get_group(current_photo)
+            if p in self._active_photo_list
+        ]
+        if len(group) < 2:
+            logui.info("No near duplicates of this photo found.")
+            if len(self._to_hash) > 0:
+                logui.info(f"Still looking at {len(self._to_hash)} photos.")
+            return
+        group.sort(key=self._active_photo_list.index)
+
+        offset = 1 if direction == "forward" else -1
+        new_photo = group[(group.index(current_photo) + offset) % len(group)]
+        new_index = self._active_photo_list.index(new_photo)
+        if which == "prim":
+            self.setIndexPrim(new_index)
+        else:
+            self.setIndexEcho(new_index)
+
+    def moveEchoInBurst(self, direction):
+        """Move echo to the next shot in the burst of prim, in time order"""
+        logg = logging.getLogger(f"c.{__class__.__name__}.moveEchoInBurst")
+        logg.info(f"Moving echo {direction} in burst")
+
+        if self.layout_current.get() not in self._layout_is_double:
+            logg.warn("Current layout is not double, can't move index echo")
+            return
+
+        current_photo_prim = self.current_photo_prim.get()
+        burst = self._get_active_burst(current_photo_prim)
+        if len(burst) < 2:
+            logui = logging.getLogger("UI")
+            logui.info("No other shots in the burst of this photo.")
+            return
+
+        # start from prim if echo is in another burst
+        current_photo_echo = self.current_photo_echo.get()
+        if current_photo_echo not in burst:
+            current_photo_echo = current_photo_prim
+        offset = 1 if direction == "forward" else -1
+        new_photo = burst[(burst.index(current_photo_echo) + offset) % len(burst)]
+        self.setIndexEcho(self._active_photo_list.index(new_photo))
+
+    def jumpBurst(self, direction):
+        """Move prim to the first shot of the next burst in the active list
+
+        In a double layout echo goes to the second shot of the burst, ready to
+        compare them
+        """
+        logg = logging.getLogger(f"c.{__class__.__name__}.jumpBurst")
+        logg.info(f"Jumping {direction} to the next burst")
+
+        old_burst = set(self._get_active_burst(self.current_photo_prim.get()))
+        offset = 1 if direction == "forward" else -1
+        new_index = self._index_prim
+        for _ in range(len(self._active_photo_list)):
+            new_index = self._active_photo_list.step(new_index, offset)
+            if self._active_photo_list[new_index] not in old_burst:
+                break
+        else:
+            logui = logging.getLogger("UI")
+            logui.info("All the active photos are in the same burst.")
+            return
+
+        # bursts can interleave in the active list, e.g. two cameras sorted by
+        # date: take the first shot past prim in the direction of the jump,
+        # on the other side of the list if the search wrapped around
+        new_burst = self._get_active_burst(self._active_photo_list[new_index])
+        wrapped = (new_index - self._index_prim) * offset < 0
+        past_prim = [
+            p
+            for p in new_burst
+            if ((self._active_photo_list.index(p) - self._index_prim) * offset > 0)
+            != wrapped
+        ]
+        first_photo = min(past_prim, key=self._active_photo_list.index)
+        self.setIndexPrim(self._active_photo_list.index(first_photo))
+
+        if self.layout_current.get() in self._layout_is_double:
+            second_photo = new_burst[
+                (new_burst.index(first_photo) + 1) % len(new_burst)
+            ]
+            self.setIndexEcho(self._active_photo_list.index(second_photo))
+
+    def _get_active_burst(self, photo_full):
+        """The active photos in the same burst as photo_full, by time
+
+        The active photos not in the BurstIndex yet are added first, only the
+        cameras of the new shots are scanned again
+        """
+        logg = logging.getLogger(f"c.{__class__.__name__}._get_active_burst")
+
+        to_add = [p for p in self._active_photo_list if p not in self._burst_index]
+        if len(to_add) > 0:
+            logg.info(f"Adding {len(to_add)} photos to the bursts")
+            self._index_metadata(to_add)
+            for p in to_add:
+                self._burst_index.add(
+                    p,
+                    self._metadata_index.get_value(p, "date"),
+                    self._metadata_index.get_value(p, "camera"),
+                )
+
+        burst = self._burst_index.get_burst(photo_full)
+        return [p for p in burst if p in self._active_photo_list]
+
+    def _publish_active_list(self):
+        """Send the PhotoInfo of the active photos, in order"""
+        logg = logging.getLogger(f"c.{__class__.__name__}._publish_active_list")
+
+        new_photo_info_active = {}
+        for photo_full in self._active_photo_list:
             # collect the active PhotoInfo object in the new dict
             new_photo_info_active[photo_full] = self._photo_info_list_all[photo_full]
 
@@ -256,19 +1379,23 @@ class Model:
 
         self.photo_info_list_active.set(new_photo_info_active)
 
-        current_photo_prim = self.current_photo_prim.get()
-        if current_photo_prim in self._active_photo_list:
-            # the photo is still in list: if needed update the index
-            self._index_prim = self._active_photo_list.index(current_photo_prim)
-        else:
-            # the photo is not in list anymore: reset to 0
-            self._index_prim = 0
-            self._update_photo_prim(self._active_photo_list[0])
-
-        # reset the echo index to follow prim
-        self._index_echo = self._index_prim
-        # reload the echo image
-        self._update_photo_echo(self._active_photo_list[self._index_echo])
+    def close(self):
+        """Release the resources held by the model"""
+        logg = logging.getLogger(f"c.{__class__.__name__}.close")
+        logg.info("Closing model")
+        logg.info(f"Cropper cache stats {self._loaded_croppers.get_stats()}")
+        logg.info(f"Render cache stats {self._render_cache.get_stats()}")
+        for folder in list(self._ingest_jobs):
+            self._cancel_ingest(folder)
+        if self._revalidate_executor is not None:
+            self._revalidate_executor.shutdown(cancel_futures=True)
+        self._folder_watcher.close()
+        self._duplicate_finder.close()
+        self._thumb_loader.close()
+        self._loaded_croppers.close()
+        self._render_pool.close()
+        if self._catalog is not None:
+            self._catalog.close()
 
     def _is_photo(self, photo_full):
         _, photo_ext = splitext(photo_full)
@@ -284,10 +1411,11 @@ class Model:
         logg = logging.getLogger(f"c.{__class__.__name__}.moveIndexPrim")
         logg.info(f"Moving index prim {direction}")
         if direction == "forward":
-            new_index_prim = self._index_prim + 1
+            new_index_prim = self._active_photo_list.step(self._index_prim, 1)
+            self._prefetch_direction = 1
         elif direction == "backward":
-            new_index_prim = self._index_prim - 1
-        new_index_prim = new_index_prim % len(self.photo_info_list_active.get())
+            new_index_prim = self._active_photo_list.step(self._index_prim, -1)
+            self._prefetch_direction = -1
         self.setIndexPrim(new_index_prim)
 
     def seekIndexPrim(self, pic):
@@ -308,6 +1436,7 @@ class Model:
         #  logg.setLevel("TRACE")
         logg.info(f"Updating photo prim, index {self._index_prim}")
         self.current_photo_prim.set(pic_prim)
+        self._pin_croppers()
 
         # resets zoom level and pos for the new photo; can only be done AFTER
         # mainloop starts, during initialization Model.doResize has not been
@@ -316,17 +1445,20 @@ class Model:
         if self._widget_wid != -1:
             crop_prim = self._loaded_croppers.get_cropper(pic_prim)
             crop_prim.reset_image(self._widget_wid, self._widget_hei)
-            self.cropped_prim.set(crop_prim.image_res)
 
             # if the layout is double, copy the new zoom level to echo pic
+            crop_echo = None
             if self.layout_current.get() in self._layout_is_double:
-                self._cloneParams()
+                crop_echo = self._cloneParams()
+            self._publishCrops(crop_prim, crop_echo)
 
         # get the metadata for the image
-        metadata_exif_prim = self._photo_info_list_all[pic_prim].get_metadata()
+        metadata_exif_prim = self._get_metadata(pic_prim)
         metadata_named_prim = self._parse_metadata(metadata_exif_prim)
         self.metadata_prim.set(metadata_named_prim)
 
+        self._prefetch_neighbours()
+
     def setIndexEcho(self, index_echo):
         logg = logging.getLogger(f"c.{__class__.__name__}.setIndexEcho")
         logg.info(f"Setting index_echo to {index_echo}")
@@ -343,15 +1475,52 @@ class Model:
             return
 
         if direction == "forward":
-            new_index_echo = self._index_echo + 1
+            new_index_echo = self._active_photo_list.step(self._index_echo, 1)
+            self._prefetch_direction = 1
         elif direction == "backward":
-            new_index_echo = self._index_echo - 1
+            new_index_echo = self._active_photo_list.step(self._index_echo, -1)
+            self._prefetch_direction = -1
         elif direction == "sync":
             new_index_echo = self._index_prim
 
-        new_index_echo = new_index_echo % len(self.photo_info_list_active.get())
         self.setIndexEcho(new_index_echo)
 
+    def _prefetch_neighbours(self):
+        """Decode in the background the photos next to prim and echo
+
+        The closest ones in the direction of the last move come first, the
+        work on photos that are not neighbours anymore is cancelled
+        """
+        # the croppers are used only when the widget size is known
+        if self._widget_wid == -1 or len(self._active_photo_list) == 0:
+            return
+
+        indexes = [self._index_prim]
+        if self.layout_current.get() in self._layout_is_double:
+            indexes.append(self._index_echo)
+        offsets = [
+            self._prefetch_direction * (i + 1) for i in range(self._prefetch_ahead)
+        ]
+        offsets += [
+            -self._prefetch_direction * (i + 1) for i in range(self._prefetch_behind)
+        ]
+
+        to_prefetch = []
+        for offset in offsets:
+            for index in indexes:
+                photo_full = self._active_photo_list[
+                    self._active_photo_list.step(index, offset)
+                ]
+                if photo_full not in to_prefetch:
+                    to_prefetch.append(photo_full)
+        self._loaded_croppers.prefetch(to_prefetch)
+
+    def _pin_croppers(self):
+        """Keep the croppers of the photos shown in the Holder"""
+        self._loaded_croppers.pin(
+            (self.current_photo_prim.get(), self.current_photo_echo.get())
+        )
+
     def _update_photo_echo(self, pic_echo):
         """Change what is needed for a new pic_echo in echo frame
 
@@ -362,18 +1531,21 @@ class Model:
         logg = logging.getLogger(f"c.{__class__.__name__}._update_photo_echo")
         logg.info(f"Updating photo echo, index {self._index_echo}")
         self.current_photo_echo.set(pic_echo)
+        self._pin_croppers()
 
         if self._widget_wid != -1:
-            self._cloneParams()
+            self._publishCrops(None, self._cloneParams())
 
         if self.layout_current.get() in self._layout_is_double:
             # get the metadata for the image
-            metadata_exif_echo = self._photo_info_list_all[pic_echo].get_metadata()
+            metadata_exif_echo = self._get_metadata(pic_echo)
             metadata_named_echo = self._parse_metadata(metadata_exif_echo)
             self.metadata_echo.set(metadata_named_echo)
         else:
             self.metadata_echo.set(None)
 
+        self._prefetch_neighbours()
+
     def likePressed(self, which_frame):
         """Update selection_list accordingly"""
         logg = logging.getLogger(f"c.{__class__.__name__}.likePressed")
@@ -402,6 +1574,7 @@ class Model:
             old_selection_list[new_pic] = [self._photo_info_list_all[new_pic], True]
 
         self.selection_list.set(old_selection_list)
+        self._save_selection()
 
     def toggleSelectionPic(self, pic):
         logg = logging.getLogger(f"c.{__class__.__name__}.toggleSelectionPic")
@@ -411,6 +1584,7 @@ class Model:
         old_selection_list = self.selection_list.get()
         old_selection_list[pic][1] = not old_selection_list[pic][1]
         self.selection_list.set(old_selection_list)
+        self._save_selection()
 
     def doResize(self, widget_wid, widget_hei):
         """Triggered by a configure event in the Label
@@ -433,28 +1607,32 @@ class Model:
         crop_prim = self._loaded_croppers.get_cropper(pic_prim)
         # reset the image zoom/pos
         crop_prim.reset_image(self._widget_wid, self._widget_hei)
-        # update the Observable
-        self.cropped_prim.set(crop_prim.image_res)
 
+        crop_echo = None
         if self.layout_current.get() in self._layout_is_double:
             # clone params to echo
-            self._cloneParams()
+            crop_echo = self._cloneParams()
+        # update the Observables
+        self._publishCrops(crop_prim, crop_echo)
 
-    def zoomImage(self, direction, rel_x=-1, rel_y=-1):
+    def zoomImage(self, direction, rel_x=-1, rel_y=-1, steps=1):
         logg = logging.getLogger(f"c.{__class__.__name__}.zoomImage")
         #  logg.setLevel("TRACE")
-        logg.trace(f"Zooming in direction {direction}")
+        logg.trace(f"Zooming in direction {direction} {steps} steps")
         # get current prim pic
         pic_prim = self.current_photo_prim.get()
         # get the cropper for the image
         crop_prim = self._loaded_croppers.get_cropper(pic_prim)
+        # while zooming draw a preview, refineCrops does the slow resize
+        preview = direction != "reset"
         # zoom the image
-        crop_prim.zoom_image(direction, rel_x, rel_y)
-        # update the Observable
-        self.cropped_prim.set(crop_prim.image_res)
+        crop_prim.zoom_image(direction, rel_x, rel_y, preview, steps)
 
+        crop_echo = None
         if self.layout_current.get() in self._layout_is_double:
-            self._cloneParams()
+            crop_echo = self._cloneParams(preview)
+        # update the Observables
+        self._publishCrops(crop_prim, crop_echo)
 
     def moveImageDirection(self, direction):
         """Move image in the specified direction of self._mov_delta"""
@@ -495,17 +1673,60 @@ class Model:
         pic_prim = self.current_photo_prim.get()
         # get the cropper for the image
         crop_prim = self._loaded_croppers.get_cropper(pic_prim)
-        # move the image
-        crop_prim.move_image(delta_x, delta_y)
-        # update the Observable
-        self.cropped_prim.set(crop_prim.image_res)
+        # move the image, drawing a preview until refineCrops
+        crop_prim.move_image(delta_x, delta_y, preview=True)
 
         # if double, move echo as well
+        crop_echo = None
+        if self.layout_current.get() in self._layout_is_double:
+            crop_echo = self._cloneParams(preview=True)
+        # update the Observables
+        self._publishCrops(crop_prim, crop_echo)
+
+    def refineCrops(self):
+        """Render again with the slow resampling the previews shown
+
+        Called when the input has been idle for a while, the previews that
+        were replaced in the meantime are never refined
+        """
+        logg = logging.getLogger(f"c.{__class__.__name__}.refineCrops")
+        #  logg.setLevel("TRACE")
+
+        if self._widget_wid == -1:
+            return
+
+        crop_prim = self._loaded_croppers.get_cropper(self.current_photo_prim.get())
+        if not crop_prim.refine():
+            crop_prim = None
+
+        crop_echo = None
         if self.layout_current.get() in self._layout_is_double:
-            self._cloneParams()
+            pic_echo = self.current_photo_echo.get()
+            crop_echo = self._loaded_croppers.get_cropper(pic_echo)
+            if not crop_echo.refine():
+                crop_echo = None
+
+        logg.trace(
+            f"Refining prim {crop_prim is not None} echo {crop_echo is not None}"
+        )
+        self._publishCrops(crop_prim, crop_echo)
 
-    def _cloneParams(self):
-        """Clone current prim params to echo image"""
+    def _publishCrops(self, crop_prim, crop_echo):
+        """Render the croppers together, then set the cropped Observables
+
+        A None cropper did not change and is not published
+        """
+        self._render_pool.render((crop_prim, crop_echo))
+        if crop_prim is not None:
+            self.cropped_prim.set(crop_prim.image_res)
+        if crop_echo is not None:
+            self.cropped_echo.set(crop_echo.image_res)
+
+    def _cloneParams(self, preview=False):
+        """Clone current prim params to echo image
+
+        Returns the echo cropper, its crop is rendered by _publishCrops
+        """
         # MAYBE the check for doubleness of the layout can be done here
         # cloning only makes sense if it's double after all
         logg = logging.getLogger(f"c.{__class__.__name__}._cloneParams")
@@ -525,9 +1746,8 @@ class Model:
         # get params from prim
         params = crop_prim.get_params()
         # copy them in echo
-        crop_echo.load_params(params)
-        # update echo observable
-        self.cropped_echo.set(crop_echo.image_res)
+        crop_echo.load_params(params, preview)
+        return crop_echo
 
     def _load_named_metadata(self):
         """Populate two dicts that map a readable name in the metadata field"""
@@ -582,14 +1802,50 @@ class ModelCrop:
         # setup parameters for resizing
         self.upscaling_mode = Image.NEAREST
         self.downscaling_mode = Image.LANCZOS
+        # fast resizing while the user is moving the image, refined later; the
+        # pyramid level is at most zoom_base larger, so it does not alias much
+        self.preview_mode = Image.NEAREST
+        # the image_res shown is a preview
+        self.is_preview = False
 
         # zoom saved in logg scale, actual zoom: zoom_base**zoom_level
         self._zoom_base = sqrt(2)
         self._zoom_level = None
 
+        # downscaled copies of the image, level k is zoom_base**k times smaller
+        # and is built when a zoom level needs it; level 0 is the image itself
+        self.use_pyramid = True
+        self._pyramid = [self._image]
+        # the modes that can be shrunk with box filters
+        self._pyramid_modes = ("L", "LA", "RGB", "RGBA", "RGBX", "CMYK")
+
         self._mov_x = 0
         self._mov_y = 0
 
+        # the last image rendered, and how, to shift it when panning
+        self.use_pan_shift = True
+        self._last_render = None
+
+        # the crop is rendered when image_res is read, see update_crop
+        self._image_res = None
+        self._render_pending = False
+        self._render_preview = False
+
+    def decode(self):
+        """Decode the image now, instead of at the first crop
+
+        Safe to call from a worker thread
+        """
+        self._image.load()
+        return self
+
+    def get_bytes(self):
+        """Memory used by the image once decoded, and by the pyramid levels"""
+        return sum(
+            level.width * level.height * len(level.getbands())
+            for level in self._pyramid
+        )
+
     def reset_image(self, widget_wid=-1, widget_hei=-1):
         """Resets zoom level and position of the image
 
@@ -619,17 +1875,80 @@ class ModelCrop:
         self._mov_y = 0
         self.update_crop()
 
-    def update_crop(self):
+    def update_crop(self, preview=False):
         """Update the cropped region with the current parameters
 
+        If preview, use the fast resampling, see render_crop
+
+        The crop is only marked as pending: it is rendered when image_res is
+        read, or by render, that can be called in a worker thread
+        """
+        self._render_pending = True
+        self._render_preview = preview
+
+    def needs_render(self):
+        return self._render_pending
+
+    def get_view_key(self):
+        """What the crop shows: the photo, zoom, position and widget size"""
+        return (
+            self._photo_name_full,
+            self._zoom_level,
+            self._mov_x,
+            self._mov_y,
+            self.widget_wid,
+            self.widget_hei,
+        )
+
+    def load_render(self, image_res):
+        """Use a final crop of the current view rendered earlier"""
+        self._image_res = image_res
+        self._render_pending = False
+        self.is_preview = False
+
+    def render(self):
+        """Render the pending crop"""
+        if self._render_pending:
+            self._image_res = self.render_crop(self._render_preview)
+            self._render_pending = False
+
+    @property
+    def image_res(self):
+        """PIL Image of the crop, the view turns it in a PhotoImage"""
+        self.render()
+        return self._image_res
+
+    def refine(self):
+        """Redo the crop with the slow resampling if a preview is shown
+
+        Returns True if the image_res changed
+        """
+        if self._render_pending:
+            # not shown yet, render it directly with the slow resampling
+            self._render_preview = False
+            return True
+        if not self.is_preview:
+            return False
+        self.update_crop()
+        return True
+
+    def render_crop(self, preview=False):
+        """Return the cropped region resized with the current parameters
+
         Image.resize takes as args
         - the output dimension (wid, hei)
         - the region to crop from (left, top, right, bottom)
 
         The Label fills the frame, and the image is centered in the Label,
         there is no need for x_pos and place
+
+        When zoomed out the region is taken from a level of the pyramid, and
+        if preview it is resized with the fast preview_mode
+
+        When only the position changed, the last image is reused, see
+        _render_pan
         """
-        logg = logging.getLogger(f"c.{__class__.__name__}.update_crop")
+        logg = logging.getLogger(f"c.{__class__.__name__}.render_crop")
         #  logg.setLevel("TRACE")
         logg.trace(f"Updating crop zoom {self._zoom_level:.4f}")
 
@@ -685,18 +2004,144 @@ class ModelCrop:
         # decide what method to use when resizing
         if zoom > 1:
             resampling_mode = self.upscaling_mode
+        elif preview:
+            resampling_mode = self.preview_mode
         else:
             resampling_mode = self.downscaling_mode
+        # when upscaling the preview is already the final image
+        self.is_preview = preview and zoom <= 1
+
+        # resize from the smallest level that is still sharp enough
+        level_num = self._pick_level()
+        level = self._get_level(level_num)
+        scale_x = level.width / self._image_wid
+        scale_y = level.height / self._image_hei
+        level_region = (
+            region[0] * scale_x,
+            region[1] * scale_y,
+            region[2] * scale_x,
+            region[3] * scale_y,
+        )
+
+        # pixels of the level in each pixel of the output, they only change
+        # with the key, computed from the region they carry some float noise
+        pixel_wid = (level_region[2] - level_region[0]) / resized_dim[0]
+        pixel_hei = (level_region[3] - level_region[1]) / resized_dim[1]
+        render_key = (level_num, resampling_mode, resized_dim, self._zoom_level)
+
+        image_res = None
+        if self.use_pan_shift:
+            image_res = self._render_pan(
+                level, render_key, level_region, pixel_wid, pixel_hei
+            )
+        if image_res is None:
+            image_res = level.resize(resized_dim, resampling_mode, level_region)
+        self._last_render = (render_key, level_region, image_res)
+        return image_res
+
+    def _render_pan(self, level, render_key, level_region, pixel_wid, pixel_hei):
+        """Shift the last image rendered and resample only the exposed strips
+
+        Works if the last image was rendered from the same level with the same
+        zoom, size and mode, and the region moved by a whole number of pixels.
+        Each pixel of the output only depends on its position in the region, so
+        the strips resampled match the full render.
+
+        Returns None if a full render is needed
+        """
+        logg = logging.getLogger(f"c.{__class__.__name__}._render_pan")
+        #  logg.setLevel("TRACE")
+
+        if self._last_render is None:
+            return None
+        last_key, last_region, last_image = self._last_render
+        if last_key != render_key:
+            return None
+
+        _, resampling_mode, (res_wid, res_hei), _ = render_key
+        shift_x = (level_region[0] - last_region[0]) / pixel_wid
+        shift_y = (level_region[1] - last_region[1]) / pixel_hei
+        if abs(shift_x - round(shift_x)) > 1e-3 or abs(shift_y - round(shift_y)) > 1e-3:
+            return None
+        shift_x = round(shift_x)
+        shift_y = round(shift_y)
+        if abs(shift_x) >= res_wid or abs(shift_y) >= res_hei:
+            return None
+        if shift_x == 0 and shift_y == 0:
+            return last_image
+        logg.trace(f"Shifting by ({shift_x}, {shift_y})")
+
+        # the part still visible, moved in the new position
+        image_res = last_image.crop(
+            (shift_x, shift_y, shift_x + res_wid, shift_y + res_hei)
+        )
+
+        # the rows exposed, as wide as the output
+        strips = []
+        top, bottom = 0, res_hei
+        if shift_y > 0:
+            top, bottom = 0, res_hei - shift_y
+            strips.append((0, bottom, res_wid, res_hei))
+        elif shift_y < 0:
+            top, bottom = -shift_y, res_hei
+            strips.append((0, 0, res_wid, top))
+        # the columns exposed, between the rows
+        if shift_x > 0:
+            strips.append((res_wid - shift_x, top, res_wid, bottom))
+        elif shift_x < 0:
+            strips.append((0, top, -shift_x, bottom))
+
+        for left, upper, right, lower in strips:
+            strip_region = (
+                level_region[0] + left * pixel_wid,
+                level_region[1] + upper * pixel_hei,
+                level_region[0] + right * pixel_wid,
+                level_region[1] + lower * pixel_hei,
+            )
+            strip = level.resize(
+                (right - left, lower - upper), resampling_mode, strip_region
+            )
+            image_res.paste(strip, (left, upper))
+
+        return image_res
+
+    def _pick_level(self):
+        """The smallest pyramid level with at least the resolution of the zoom
 
-        # apply resize
-        image_res = self._image.resize(resized_dim, resampling_mode, region)
-        # convert the photo for tkinter
-        image_res = ImageTk.PhotoImage(image_res)
-        # save it as attribute of the object, not garbage collected
-        self.image_res = image_res
+        Level k is zoom_base**-k of the image, so it is enough as long as
+        k <= -zoom_level
+        """
+        if not self.use_pyramid or self._image.mode not in self._pyramid_modes:
+            return 0
+        # tolerate the rounding of the zoom_level found in reset_image
+        return max(floor(-self._zoom_level + 1e-6), 0)
+
+    def _get_level(self, level_num):
+        """Return the pyramid level, building the missing ones
 
-    def zoom_image(self, direction, rel_x=-1, rel_y=-1):
-        """Change zoom level, keep (rel_x, rel_y) still"""
+        Each level is half the one two steps larger, shrunk with a box filter,
+        only level 1 is resized from the image itself
+        """
+        logg = logging.getLogger(f"c.{__class__.__name__}._get_level")
+
+        while len(self._pyramid) <= level_num:
+            new_num = len(self._pyramid)
+            if new_num == 1:
+                scale = self._zoom_base ** -1
+                new_dim = (
+                    ceil(self._image_wid * scale),
+                    ceil(self._image_hei * scale),
+                )
+                new_level = self._image.resize(new_dim, Image.BOX)
+            else:
+                new_level = self._pyramid[new_num - 2].reduce(2)
+            logg.debug(f"Built level {new_num} {new_level.size}")
+            self._pyramid.append(new_level)
+
+        return self._pyramid[level_num]
+
+    def zoom_image(self, direction, rel_x=-1, rel_y=-1, preview=False, steps=1):
+        """Change zoom level of steps, keep (rel_x, rel_y) still"""
         logg = logging.getLogger(f"c.{__class__.__name__}.zoom_image")
         #  logg.setLevel("TRACE")
         logg.info(f"Zooming image {direction}")
@@ -706,9 +2151,9 @@ class ModelCrop:
         old_zoom_hei = self._image_hei * old_zoom
 
         if direction == "in":
-            self._zoom_level += 1
+            self._zoom_level += steps
         elif direction == "out":
-            self._zoom_level -= 1
+            self._zoom_level -= steps
         elif direction == "reset":
             self.reset_image()
             return 0
@@ -780,7 +2225,7 @@ class ModelCrop:
         recap = f"mov_x {self._mov_x} mov_y {self._mov_y}"
         logg.trace(recap)
 
-        self.update_crop()
+        self.update_crop(preview)
 
     def get_params(self):
         """Returns all the relevant params for the pic
@@ -795,22 +2240,33 @@ class ModelCrop:
         params["widget_hei"] = self.widget_hei
         return params
 
-    def load_params(self, params):
-        """Crop the photo according to params"""
+    def load_params(self, params, preview=False):
+        """Crop the photo according to params
+
+        If the view is already the same, the crop is not rendered again, so
+        many panes on the same photo share the image_res
+        """
+        if (
+            self._image_res is not None
+            and not self._render_pending
+            and params == self.get_params()
+            and (preview or not self.is_preview)
+        ):
+            return
         self._mov_x = params["mov_x"]
         self._mov_y = params["mov_y"]
         self._zoom_level = params["zoom_level"]
         self.widget_wid = params["widget_wid"]
         self.widget_hei = params["widget_hei"]
         # MAYBE do validation on params, pic might be of different size
-        self.update_crop()
+        self.update_crop(preview)
 
-    def move_image(self, delta_x, delta_y):
+    def move_image(self, delta_x, delta_y, preview=False):
         """Move image of specified delta"""
         self._mov_x += delta_x
         self._mov_y += delta_y
         self._validate_mov()
-        self.update_crop()
+        self.update_crop(preview)
 
     def _validate_mov(self):
         """Check that mov is reasonable for the current widget/image/zoom"""
@@ -862,30 +2318,225 @@ class ModelCrop:
 
 
 class Holder:
-    """Basic interface for a Holder, that might work in the future as a LRU cache
+    """LRU cache of the croppers, bounded by their number and decoded bytes
 
-    The implementation will be a dict for now
+    The croppers of the photos shown are pinned: they are never evicted, even
+    if that goes over budget, as they are needed right away.
+
+    The neighbours of the photos shown can be decoded in advance by a pool of
+    threads, with prefetch; they are added to the cache from the main thread,
+    when next used or at the next prefetch.
     """
 
-    def __init__(self, cache_dim):
+    def __init__(self, cache_dim, max_bytes=2 ** 30):
         logg = logging.getLogger(f"c.{__class__.__name__}.init")
         logg.info("Start init")
 
+        self.cache_dim = cache_dim
+        self.max_bytes = max_bytes
+
+        # {image_name: ModelCrop} ordered from least to most recently used
         self._loaded_croppers = {}
+        # image names that can't be evicted
+        self._pinned = set()
+
+        # {image_name: Future} of the croppers being decoded
+        self._prefetching = {}
+        # {image_name: bytes} of the decoded image, read from the header
+        self._estimated_bytes = {}
+        # the pool is created when first needed
+        self._executor = None
+        self._num_workers = 2
+
+        # statistics for the session
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.prefetched = 0
 
     def get_cropper(self, image_name):
         """Return the requested cropper, if not loaded, create it on the fly"""
         logg = logging.getLogger(f"c.{__class__.__name__}.get_cropper")
         logg.trace("Getting cropper")
 
-        if image_name not in self._loaded_croppers:
+        self._collect_prefetched()
+        future = self._prefetching.pop(image_name, None)
+        if future is not None and not future.cancel():
+            # already being decoded, wait for it
+            self._add_prefetched(image_name, future)
+
+        if image_name in self._loaded_croppers:
+            # mark as most recently used
+            cropper = self._loaded_croppers.pop(image_name)
+            self._loaded_croppers[image_name] = cropper
+            self.hits += 1
+        else:
+            self.misses += 1
             self._load_cropper(image_name)
+            self._evict(image_name)
 
         return self._loaded_croppers[image_name]
 
+    def pin(self, image_names):
+        """Pin the croppers of image_names, unpin all the others"""
+        self._pinned = set(image_names)
+        self._evict()
+
+    def discard(self, image_name):
+        """Drop and unpin the cropper of the image, e.g. when it changed on disk
+
+        A decode still running in the background is dropped when done, so the
+        old image is not added back
+        """
+        future = self._prefetching.pop(image_name, None)
+        if future is not None:
+            future.cancel()
+        self._loaded_croppers.pop(image_name, None)
+        self._pinned.discard(image_name)
+        self._estimated_bytes.pop(image_name, None)
+
+    def prefetch(self, image_names):
+        """Decode the croppers of image_names in the background, in order
+
+        Only as many as fit in cache_dim and max_bytes next to the pinned ones
+        are decoded, so that they do not evict each other; the other croppers
+        loaded are evicted to make room, and the pending work on the other
+        images is cancelled
+        """
+        logg = logging.getLogger(f"c.{__class__.__name__}.prefetch")
+
+        self._collect_prefetched()
+        free_slots = max(self.cache_dim - len(self._pinned), 0)
+        wanted = []
+        wanted_bytes = sum(
+            self._loaded_croppers[n].get_bytes()
+            for n in self._pinned
+            if n in self._loaded_croppers
+        )
+        for image_name in image_names:
+            if len(wanted) == free_slots:
+                break
+            if image_name in self._pinned:
+                continue
+            if image_name in self._loaded_croppers:
+                wanted_bytes += self._loaded_croppers[image_name].get_bytes()
+            else:
+                wanted_bytes += self._estimate_bytes(image_name)
+            if wanted_bytes > self.max_bytes:
+                logg.debug(f"Prefetch stopped at '{image_name}', over budget")
+                break
+            wanted.append(image_name)
+
+        # mark the neighbours loaded as most recently used, so that the others
+        # are evicted first
+        for image_name in reversed(wanted):
+            if image_name in self._loaded_croppers:
+                self._loaded_croppers[image_name] = self._loaded_croppers.pop(
+                    image_name
+                )
+
+        for image_name in list(self._prefetching):
+            if image_name not in wanted:
+                # if already running it is dropped when done
+                self._prefetching.pop(image_name).cancel()
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self._num_workers)
+        for image_name in wanted:
+            if image_name in self._loaded_croppers or image_name in self._prefetching:
+                continue
+            logg.debug(f"Prefetching '{image_name}'")
+            self._prefetching[image_name] = self._executor.submit(
+                self._decode_cropper, image_name
+            )
+
+    def _estimate_bytes(self, image_name):
+        """Bytes of the image once decoded, as counted by ModelCrop.get_bytes
+
+        Only the header is read, the pyramid levels are not counted
+        """
+        if image_name not in self._estimated_bytes:
+            try:
+                with Image.open(image_name) as image:
+                    image_bytes = image.width * image.height * len(image.getbands())
+            except Exception:
+                # it will fail when decoded as well
+                image_bytes = 0
+            self._estimated_bytes[image_name] = image_bytes
+        return self._estimated_bytes[image_name]
+
+    def close(self):
+        """Stop the prefetch"""
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+
+    def get_stats(self):
+        """Return the statistics of the cache as a dict"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "prefetched": self.prefetched,
+            "croppers": len(self._loaded_croppers),
+            "loaded_bytes": self.get_loaded_bytes(),
+        }
+
     def _load_cropper(self, image_name):
         """Load the cropper"""
         logg = logging.getLogger(f"c.{__class__.__name__}._load_cropper")
         logg.info("Loading cropper")
 
-        self._loaded_croppers[image_name] = ModelCrop(image_name)
+        cropper = ModelCrop(image_name)
+        self._loaded_croppers[image_name] = cropper
+
+    def get_loaded_bytes(self):
+        """Decoded bytes of all the loaded croppers, the pyramids grow over time"""
+        return sum(c.get_bytes() for c in self._loaded_croppers.values())
+
+    @staticmethod
+    def _decode_cropper(image_name):
+        """Create and decode the cropper, runs in a worker thread"""
+        return ModelCrop(image_name).decode()
+
+    def _collect_prefetched(self):
+        """Add to the cache the croppers decoded in the background"""
+        for image_name in list(self._prefetching):
+            if self._prefetching[image_name].done():
+                self._add_prefetched(image_name, self._prefetching.pop(image_name))
+
+    def _add_prefetched(self, image_name, future):
+        """Add the cropper of the future, waiting for it if needed"""
+        logg = logging.getLogger(f"c.{__class__.__name__}._add_prefetched")
+        try:
+            cropper = future.result()
+        except Exception as e:
+            # also cancelled or broken, get_cropper loads it again if needed
+            logg.warn(f"Failed to prefetch '{image_name}': {e!r}")
+            return
+        if image_name in self._loaded_croppers:
+            return
+        self._loaded_croppers[image_name] = cropper
+        self.prefetched += 1
+        self._evict(image_name)
+
+    def _evict(self, keep=None):
+        """Drop the least recently used croppers until within budget
+
+        The pinned croppers and keep are skipped
+        """
+        logg = logging.getLogger(f"c.{__class__.__name__}._evict")
+
+        loaded_bytes = self.get_loaded_bytes()
+        for image_name in list(self._loaded_croppers):
+            if (
+                len(self._loaded_croppers) <= self.cache_dim
+                and loaded_bytes <= self.max_bytes
+            ):
+                break
+            if image_name in self._pinned or image_name == keep:
+                continue
+            cropper = self._loaded_croppers.pop(image_name)
+            loaded_bytes -= cropper.get_bytes()
+            self.evictions += 1
+            logg.debug(f"Evicted '{image_name}', {loaded_bytes} bytes loaded")
@@ -0,0 +1,190 @@
+from math import cos
+from math import pi
+from math import sqrt
+import logging
+
+from PIL import Image  # type: ignore
+import numpy as np
+
+# number of bits set in each byte, to count the bits of uint64 arrays
+_popcount8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount(values):
+    """Number of bits set in each element of an array of uint64"""
+    values = np.ascontiguousarray(values, dtype=np.uint64)
+    return _popcount8[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def _bits_to_int(bits):
+    """Pack an array of 64 booleans in an int"""
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def dhash(image, hash_size=8):
+    """Difference hash: is each pixel brighter than the one on its right
+
+    Works well on the tiny thumbnails, and is robust to small changes in
+    exposure and compression
+    """
+    small = image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = np.asarray(small, dtype=np.int16)
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def _dct_matrix(size):
+    """Orthonormal DCT-II matrix"""
+    dct = np.empty((size, size))
+    for k in range(size):
+        scale = sqrt(1 / size) if k == 0 else sqrt(2 / size)
+        for n in range(size):
+            dct[k, n] = scale * cos(pi * (2 * n + 1) * k / (2 * size))
+    return dct
+
+
+_dct_32 = _dct_matrix(32)
+
+
+def phash(image, hash_size=8):
+    """Perceptual hash: sign of the low frequencies of the DCT of the image
+
+    Slower than dhash, more robust to crops and gamma changes
+    """
+    small = image.convert("L").resize((32, 32), Image.BILINEAR)
+    pixels = np.asarray(small, dtype=np.float64)
+    freq = (_dct_32 @ pixels @ _dct_32.T)[:hash_size, :hash_size]
+    # skip the DC term when computing the median
+    median = np.median(freq.ravel()[1:])
+    return _bits_to_int(freq > median)
+
+
+class NearDuplicateIndex:
+    """Group photos whose 64 bit hashes are within max_distance bits
+
+    Multi-index hashing: the hash is split in max_distance + 1 chunks, and
+    two hashes within max_distance bits must share at least one chunk exactly,
+    so only the photos with the same value in a chunk are compared. For each
+    chunk the hashes are sorted on the chunk value, the photos with the same
+    value end up next to each other and are compared with vectorized xors.
+
+    The groups are the connected components of the near pairs, found with a
+    union find. They are computed when first needed after a change.
+    """
+
+    def __init__(self, max_distance=4):
+        logg = logging.getLogger(f"c.{__class__.__name__}.init")
+        logg.info("Start init")
+
+        self.max_distance = max_distance
+
+        # bit offset and width of each chunk
+        num_chunks = max_distance + 1
+        self._chunks = []
+        start = 0
+        for i in range(num_chunks):
+            width = (64 - start) // (num_chunks - i)
+            self._chunks.append((start, width))
+            start += width
+
+        # {key: hash}
+        self._hash = {}
+        # {key: [keys in the group]} computed when needed
+        self._groups = None
+
+    def add(self, key, photo_hash):
+        """Add the hash of a photo, replacing the old one"""
+        self._hash[key] = photo_hash
+        self._groups = None
+
+    def discard(self, key):
+        """Forget the hash of a photo"""
+        if self._hash.pop(key, None) is not None:
+            self._groups = None
+
+    def rename(self, key, new_key):
+        """Move the hash to a new key"""
+        photo_hash = self._hash.pop(key, None)
+        if photo_hash is not None:
+            self.add(new_key, photo_hash)
+
+    def __contains__(self, key):
+        return key in self._hash
+
+    def get_group(self, key):
+        """All the keys in the same group as key, itself included"""
+        if key not in self._hash:
+            return []
+        return self._get_groups().get(key, [key])
+
+    def get_groups(self):
+        """List of the groups with more than one photo"""
+        groups = {}
+        for group in self._get_groups().values():
+            groups[id(group)] = group
+        return list(groups.values())
+
+    def _get_groups(self):
+        if self._groups is None:
+            self._groups = self._build_groups()
+        return self._groups
+
+    def _build_groups(self):
+        """Find the near pairs chunk by chunk, then join them in groups
+
+        Returns {key: group} for the keys in a group with more than one photo,
+        all the keys of a group share the same list
+        """
+        logg = logging.getLogger(f"c.{__class__.__name__}._build_groups")
+        logg.info(f"Grouping {len(self._hash)} hashes")
+
+        keys = list(self._hash)
+        hashes = np.fromiter(self._hash.values(), dtype=np.uint64, count=len(keys))
+
+        # union find on the positions in keys
+        parent = list(range(len(keys)))
+
+        def find(i):
+            root = i
+            while parent[root] != root:
+                root = parent[root]
+            while parent[i] != root:
+                parent[i], i = root, parent[i]
+            return root
+
+        for first, second in self._near_pairs(hashes):
+            for i, j in zip(first.tolist(), second.tolist()):
+                root_i, root_j = find(i), find(j)
+                if root_i != root_j:
+                    parent[root_j] = root_i
+
+        members = {}
+        for i in range(len(keys)):
+            members.setdefault(find(i), []).append(keys[i])
+        groups = {}
+        for group in members.values():
+            if len(group) > 1:
+                for key in group:
+                    groups[key] = group
+        logg.info(f"Found {len(members)} groups")
+        return groups
+
+    def _near_pairs(self, hashes):
+        """Generator of the arrays of positions (i, j) of the near hashes"""
+        for start, width in self._chunks:
+            chunk = (hashes >> np.uint64(start)) & np.uint64((1 << width) - 1)
+            order = np.argsort(chunk, kind="stable")
+            sorted_chunk = chunk[order]
+            sorted_hashes = hashes[order]
+
+            # compare each hash with the ones after it that share the chunk
+            offset = 1
+            while offset < len(order):
+                same = sorted_chunk[offset:] == sorted_chunk[:-offset]
+                if not same.any():
+                    break
+                first = np.nonzero(same)[0]
+                second = first + offset
+                distances = popcount(sorted_hashes[first] ^ sorted_hashes[second])
+                near = distances <= self.max_distance
+                yield order[first[near]], order[second[near]]
+                offset += 1
@@ -0,0 +1,51 @@
+class PhotoIndex:
+    """Ordered list of photos, that also knows the position of each one
+
+    Behaves like a read only list of full paths, but membership and index are
+    O(1) thanks to a {photo_full: position} map kept in sync with the list.
+    The order is changed only as a whole with set_photos, after a toggle, a
+    new sort or a new filter, and that costs O(n) once.
+    """
+
+    def __init__(self, photo_list=()):
+        self.set_photos(photo_list)
+
+    def set_photos(self, photo_list):
+        """Replace the photos, in the given order; duplicates are dropped"""
+        self._photos = []
+        self._position = {}
+        for photo_full in photo_list:
+            if photo_full in self._position:
+                continue
+            self._position[photo_full] = len(self._photos)
+            self._photos.append(photo_full)
+
+    def index(self, photo_full):
+        """Position of the photo, raises ValueError if missing, like list.index"""
+        try:
+            return self._position[photo_full]
+        except KeyError:
+            raise ValueError(f"'{photo_full}' is not in the index") from None
+
+    def get_index(self, photo_full, default=None):
+        """Position of the photo, default if missing"""
+        return self._position.get(photo_full, default)
+
+    def step(self, index, offset):
+        """Index offset positions away, wrapping around the ends"""
+        return (index + offset) % len(self._photos)
+
+    def __contains__(self, photo_full):
+        return photo_full in self._position
+
+    def __getitem__(self, index):
+        return self._photos[index]
+
+    def __iter__(self):
+        return iter(self._photos)
+
+    def __len__(self):
+        return len(self._photos)
+
+    def __repr__(self):
+        return f"PhotoIndex({self._photos!r})"
@@ -1,37 +1,265 @@
+from io import BytesIO
 import logging
+import struct
 
 from PIL import Image  # type: ignore
 import exifread  # type: ignore
 
 
+def read_jpeg_header(photo_name_full):
+    """Walk the JPEG markers until the compressed data starts
+
+    Returns (exif_bytes, width, height): the TIFF payload of the Exif APP1
+    segment (None if missing) and the dimensions from the SOF segment (None if
+    not found, e.g. the file is not a JPEG)
+    """
+    exif_bytes = None
+    width, height = None, None
+
+    with open(photo_name_full, "rb") as f:
+        if f.read(2) != b"\xff\xd8":
+            return exif_bytes, width, height
+
+        while True:
+            marker = f.read(2)
+            if len(marker) < 2 or marker[0] != 0xFF:
+                break
+            # fill bytes before the marker
+            while marker[1] == 0xFF:
+                marker = marker[1:] + f.read(1)
+                if len(marker) < 2:
+                    return exif_bytes, width, height
+            kind = marker[1]
+
+            # start of scan or end of image: the header is over
+            if kind in (0xDA, 0xD9):
+                break
+            # markers without a payload
+            if kind == 0x01 or 0xD0 <= kind <= 0xD7:
+                continue
+
+            seg_len_bytes = f.read(2)
+            if len(seg_len_bytes) < 2:
+                break
+            seg_len = struct.unpack(">H", seg_len_bytes)[0] - 2
+
+            # APP1, might be Exif or XMP
+            if kind == 0xE1 and exif_bytes is None:
+                payload = f.read(seg_len)
+                if payload[:6] == b"Exif\0\0":
+                    exif_bytes = payload[6:]
+
+            # start of frame, not DHT, JPG or DAC
+            elif 0xC0 <= kind <= 0xCF and kind not in (0xC4, 0xC8, 0xCC):
+                payload = f.read(seg_len)
+                if len(payload) >= 5:
+                    height, width = struct.unpack(">HH", payload[1:5])
+
+            else:
+                f.seek(seg_len, 1)
+
+    return exif_bytes, width, height
+
+
+def load_exif_thumb_data(photo_name_full, thumb_size=50):
+    """Build the thumbnail data from the thumbnail embedded in the EXIF
+
+    Only the header of the JPEG is read, the compressed image is not touched.
+    Returns None if there is no embedded thumbnail.
+    """
+    logg = logging.getLogger("c.load_exif_thumb_data")
+    #  logg.setLevel("TRACE")
+
+    exif_bytes, width, height = read_jpeg_header(photo_name_full)
+    if exif_bytes is None or width is None:
+        logg.trace(f"No EXIF or SOF in '{photo_name_full}'")
+        return None
+
+    # the payload of APP1 is a TIFF file that exifread can parse on its own
+    tags = exifread.process_file(BytesIO(exif_bytes), details=False)
+    embedded = tags.get("JPEGThumbnail")
+    if embedded is None:
+        logg.trace(f"No embedded thumbnail in '{photo_name_full}'")
+        return None
+
+    try:
+        thumb = Image.open(BytesIO(embedded))
+        thumb.thumbnail((thumb_size, thumb_size), Image.BOX)
+    except OSError as e:
+        logg.trace(f"Broken embedded thumbnail in '{photo_name_full}': {e}")
+        return None
+    if thumb.mode != "RGB":
+        thumb = thumb.convert("RGB")
+
+    thumb_wid, thumb_hei = thumb.size
+    return (width, height, thumb.mode, thumb_wid, thumb_hei, thumb.tobytes())
+
+
+def load_thumb_data(photo_name_full, thumb_size=50, thumb_mode="draft"):
+    """Decode and shrink the pic, return compact thumbnail data
+
+    Module level function so that it can be sent to a worker process.
+
+    thumb_mode:
+    - full: decode the whole pic, then shrink it
+    - draft: let the JPEG decoder work at 1/2, 1/4 or 1/8 scale, picking the
+      smallest that is still at least thumb_size; other formats are fully decoded
+    - exif: use the thumbnail embedded in the EXIF of the JPEG, only reading the
+      header; if there is none, fall back to draft
+
+    Returns a tuple (width, height, thumb_mode, thumb_wid, thumb_hei, thumb_bytes)
+    with the real dimensions of the pic and the raw pixels of the thumbnail
+    """
+    if thumb_mode == "exif":
+        thumb_data = load_exif_thumb_data(photo_name_full, thumb_size)
+        if thumb_data is not None:
+            return thumb_data
+        thumb_mode = "draft"
+
+    thumb = Image.open(photo_name_full)
+
+    # also save the real dimensions, draft changes the size
+    width, height = thumb.size
+
+    if thumb_mode == "draft":
+        # only does something for JPEG
+        thumb.draft(thumb.mode, (thumb_size, thumb_size))
+        reducing_gap = 2.0
+    else:
+        # thumbnail would call draft as well, force the full decode
+        reducing_gap = None
+
+    thumb.thumbnail((thumb_size, thumb_size), Image.BOX, reducing_gap)
+    # MAYBE lanczos is fast enough to be viable
+    #  thumb.thumbnail((thumb_size, thumb_size), Image.LANCZOS)
+
+    # keep only modes that survive a round trip through raw bytes
+    if thumb.mode not in ("RGB", "RGBA", "L"):
+        if thumb.mode in ("LA", "PA") or "transparency" in thumb.info:
+            thumb = thumb.convert("RGBA")
+        else:
+            thumb = thumb.convert("RGB")
+
+    thumb_wid, thumb_hei = thumb.size
+    return (width, height, thumb.mode, thumb_wid, thumb_hei, thumb.tobytes())
+
+
 class PhotoInfo:
-    def __init__(self, photo_name_full, thumb_size=50):
+    def __init__(
+        self,
+        photo_name_full,
+        thumb_size=50,
+        thumb_data=None,
+        thumb_mode="draft",
+        dimensions=None,
+    ):
+        """Info on a photo: dimensions, thumbnail and metadata
+
+        Only the header of the pic is read here, the thumbnail is produced when
+        first accessed. If thumb_data is given (as returned by load_thumb_data)
+        or the (width, height) dimensions are already known, the pic is not
+        opened at all.
+        """
         self.photo_name_full = photo_name_full
         self.thumb_size = thumb_size
+        self.thumb_mode = thumb_mode
+
+        # read from the header, None if the pic was not opened
+        self.format = None
+        self.orientation = None
 
-        self._load_thumbnail()
+        # the thumbnail, and the Future that will produce its data
+        self._thumb = None
+        self._thumb_future = None
+
+        if thumb_data is not None:
+            self._set_thumb_data(thumb_data)
+        elif dimensions is not None:
+            self.width, self.height = dimensions
+        else:
+            self._load_header()
 
         self._define_useful_tags()
         self.metadata = None
 
+    @property
+    def thumb(self):
+        """The thumbnail, produced on first access"""
+        if self._thumb is None:
+            self._load_thumbnail()
+        return self._thumb
+
+    def set_thumb_future(self, thumb_future):
+        """Get the thumb_data from a Future instead of decoding the pic here"""
+        self._thumb_future = thumb_future
+
+    def thumb_is_pending(self):
+        """True if accessing thumb would wait on a worker that is not done"""
+        return (
+            self._thumb is None
+            and self._thumb_future is not None
+            and not self._thumb_future.done()
+        )
+
     def get_metadata(self):
         if self.metadata is None:
             self._load_metadata()
         return self.metadata
 
+    def _load_header(self):
+        """Read format, size and orientation, the pixels are not decoded"""
+        with Image.open(self.photo_name_full) as img:
+            self.format = img.format
+            self.width, self.height = img.size
+            self.orientation = img.getexif().get(0x0112, 1)
+
     def _load_thumbnail(self):
-        """resize the pic"""
-        # logg = logging.getLogger(f"c.{__class__.__name__}._load_metadata")
+        """Get the thumb_data from the worker, or decode the pic here"""
+        logg = logging.getLogger(f"c.{__class__.__name__}._load_thumbnail")
         #  logg.setLevel("TRACE")
+        logg.trace(f"Loading thumbnail for '{self.photo_name_full}'")
+
+        thumb_data = None
+        if self._thumb_future is not None:
+            thumb_future = self._thumb_future
+            self._thumb_future = None
+            try:
+                thumb_data = thumb_future.result()
+            except (OSError, Image.DecompressionBombError) as e:
+                # the file is broken, no point in reading it again here
+                self._set_placeholder(e)
+                return
+            except Exception as e:
+                # the pool broke or was closed, e.g. BrokenProcessPool or
+                # CancelledError: decode the pic here
+                logg.warn(f"Thumbnail worker failed on '{self.photo_name_full}': {e!r}")
+
+        if thumb_data is None:
+            try:
+                thumb_data = load_thumb_data(
+                    self.photo_name_full, self.thumb_size, self.thumb_mode
+                )
+            except Exception as e:
+                # also DecompressionBombError, and anything the decoder raises
+                self._set_placeholder(e)
+                return
+
+        self._set_thumb_data(thumb_data)
+
+    def _set_placeholder(self, error):
+        """Use a gray thumbnail, the header was fine so keep the dimensions"""
+        logg = logging.getLogger(f"c.{__class__.__name__}._set_placeholder")
+        logg.warn(f"Failed to load thumbnail for '{self.photo_name_full}': {error!r}")
+        self._thumb = Image.new("RGB", (self.thumb_size, self.thumb_size), "gray")
 
-        self.thumb = Image.open(self.photo_name_full)
+    def _set_thumb_data(self, thumb_data):
+        """Build the thumbnail from the compact data"""
+        width, height, thumb_mode, thumb_wid, thumb_hei, thumb_bytes = thumb_data
 
-        # also save the real dimensions
-        self.width, self.height = self.thumb.size
+        # save the real dimensions
+        self.width, self.height = width, height
 
-        self.thumb.thumbnail((self.thumb_size, self.thumb_size), Image.BOX)
-        # MAYBE lanczos is fast enough to be viable
-        #  self.thumb.thumbnail((self.thumb_size, self.thumb_size), Image.LANCZOS)
+        self._thumb = Image.frombytes(thumb_mode, (thumb_wid, thumb_hei), thumb_bytes)
 
     def _load_metadata(self):
         """Load metadata for Photo, according to useful list"""
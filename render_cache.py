@@ -0,0 +1,77 @@
+import logging
+
+
+class RenderCache:
+    """LRU cache of the crops rendered, bounded by their bytes
+
+    The crops are keyed by the view they show, see ModelCrop.get_view_key:
+    going back to a photo shown recently, at the same zoom and position, reuses
+    the crop instead of resampling the photo again. Only the final crops are
+    saved, the previews are replaced quickly anyway.
+    """
+
+    def __init__(self, max_bytes=2 ** 28):
+        logg = logging.getLogger(f"c.{__class__.__name__}.init")
+        logg.info("Start init")
+
+        self.max_bytes = max_bytes
+
+        # {view_key: PIL Image} ordered from least to most recently used
+        self._crops = {}
+        self._bytes = 0
+
+        # statistics for the session
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, view_key):
+        """The crop of the view, None if not cached"""
+        image = self._crops.pop(view_key, None)
+        if image is None:
+            self.misses += 1
+            return None
+        # mark as most recently used
+        self._crops[view_key] = image
+        self.hits += 1
+        return image
+
+    def put(self, view_key, image):
+        """Save the crop of the view, evicting the oldest ones if over budget"""
+        logg = logging.getLogger(f"c.{__class__.__name__}.put")
+
+        self._drop(view_key)
+        image_bytes = self._get_bytes(image)
+        if image_bytes > self.max_bytes:
+            return
+        self._crops[view_key] = image
+        self._bytes += image_bytes
+
+        while self._bytes > self.max_bytes:
+            self._drop(next(iter(self._crops)))
+            self.evictions += 1
+        logg.trace(f"{len(self._crops)} crops cached, {self._bytes} bytes")
+
+    def discard_photo(self, photo_full):
+        """Drop all the crops of the photo, e.g. when it changed on disk"""
+        for view_key in [k for k in self._crops if k[0] == photo_full]:
+            self._drop(view_key)
+
+    def get_stats(self):
+        """Return the statistics of the cache as a dict"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "crops": len(self._crops),
+            "bytes": self._bytes,
+        }
+
+    def _drop(self, view_key):
+        image = self._crops.pop(view_key, None)
+        if image is not None:
+            self._bytes -= self._get_bytes(image)
+
+    @staticmethod
+    def _get_bytes(image):
+        return image.width * image.height * len(image.getbands())
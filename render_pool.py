@@ -0,0 +1,78 @@
+from concurrent.futures import ThreadPoolExecutor
+import logging
+
+
+class RenderPool:
+    """Render the pending crops of many croppers at the same time
+
+    The resampling in Pillow releases the GIL, so the crops of prim and echo
+    can be rendered in parallel: the first cropper is rendered in the calling
+    thread, the others in a small pool of threads. Each cropper is rendered by
+    a single thread, and render returns only when all are done, so the crops
+    can be shown together.
+
+    With num_workers 0 the croppers are rendered one after the other.
+
+    With a RenderCache, the views rendered recently are taken from it instead.
+    """
+
+    def __init__(self, num_workers=1, render_cache=None):
+        logg = logging.getLogger(f"c.{__class__.__name__}.init")
+        logg.info("Start init")
+
+        self.num_workers = num_workers
+        self.render_cache = render_cache
+
+        # the pool is created when first needed
+        self._executor = None
+
+    def render(self, croppers):
+        """Render the croppers with a pending crop, None entries are skipped"""
+        logg = logging.getLogger(f"c.{__class__.__name__}.render")
+        #  logg.setLevel("TRACE")
+
+        # the same cropper can be in the list twice, e.g. prim and echo on
+        # the same photo, render it once
+        pending = []
+        for cropper in croppers:
+            if cropper is None or not cropper.needs_render():
+                continue
+            if any(cropper is other for other in pending):
+                continue
+            pending.append(cropper)
+
+        if self.render_cache is not None:
+            pending = [c for c in pending if not self._load_cached(c)]
+        logg.trace(f"Rendering {len(pending)} croppers")
+
+        if self.num_workers == 0 or len(pending) < 2:
+            for cropper in pending:
+                cropper.render()
+        else:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.num_workers)
+            futures = [self._executor.submit(cropper.render) for cropper in pending[1:]]
+            pending[0].render()
+            # wait for the others, raising their errors here
+            for future in futures:
+                future.result()
+
+        if self.render_cache is not None:
+            for cropper in pending:
+                if not cropper.is_preview:
+                    self.render_cache.put(cropper.get_view_key(), cropper.image_res)
+
+    def _load_cached(self, cropper):
+        """Use the cached crop of the view if present, returns True if found
+
+        A final crop is good also when a preview was requested
+        """
+        image_res = self.render_cache.get(cropper.get_view_key())
+        if image_res is None:
+            return False
+        cropper.load_render(image_res)
+        return True
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
@@ -0,0 +1,97 @@
+from timeit import default_timer as timer
+import logging
+
+
+class RenderScheduler:
+    """Coalesce the mouse and resize events before they reach the model
+
+    Tk delivers many more motion, wheel and Configure events than the model can
+    render. The events are accumulated: the drag keeps only the last mouse
+    position, the wheel the net number of zoom steps and the resize the final
+    size. They are applied together when Tk is idle, at most once per frame.
+    """
+
+    def __init__(self, root, model, frame_time=1 / 60):
+        logg = logging.getLogger(f"c.{__class__.__name__}.init")
+        logg.info("Start init")
+
+        self.root = root
+        self.model = model
+        # minimum seconds between two flushes
+        self.frame_time = frame_time
+
+        # last mouse position of the drag, None if no drag pending
+        self._mouse_pos = None
+        # net zoom steps, positive is in, and where the wheel was
+        self._zoom_steps = 0
+        self._zoom_pos = (-1, -1)
+        # final widget size, and the one last sent to the model
+        self._widget_size = None
+        self._sent_widget_size = None
+
+        # id of the scheduled flush, None if not scheduled
+        self._flush_id = None
+        self._last_flush = 0
+
+    def move_mouse(self, mouse_x, mouse_y):
+        """The image is dragged to the mouse position"""
+        self._mouse_pos = (mouse_x, mouse_y)
+        self._schedule()
+
+    def press_mouse(self, mouse_x, mouse_y):
+        """A new drag starts, the old one is completed first"""
+        if self._mouse_pos is not None:
+            self.flush()
+        self.model.saveMousePos(mouse_x, mouse_y)
+
+    def zoom(self, direction, rel_x=-1, rel_y=-1):
+        """One step of zoom in or out, centered in (rel_x, rel_y)"""
+        self._zoom_steps += 1 if direction == "in" else -1
+        self._zoom_pos = (rel_x, rel_y)
+        self._schedule()
+
+    def resize(self, widget_wid, widget_hei):
+        """The widget changed size"""
+        self._widget_size = (widget_wid, widget_hei)
+        self._schedule()
+
+    def _schedule(self):
+        """Flush when Tk is idle, waiting for the end of the current frame"""
+        if self._flush_id is not None:
+            return
+        wait = self._last_flush + self.frame_time - timer()
+        if wait > 0:
+            self._flush_id = self.root.after(int(wait * 1000) + 1, self._schedule_idle)
+        else:
+            self._flush_id = self.root.after_idle(self.flush)
+
+    def _schedule_idle(self):
+        self._flush_id = self.root.after_idle(self.flush)
+
+    def flush(self):
+        """Send the accumulated events to the model"""
+        logg = logging.getLogger(f"c.{__class__.__name__}.flush")
+        #  logg.setLevel("TRACE")
+
+        if self._flush_id is not None:
+            self.root.after_cancel(self._flush_id)
+            self._flush_id = None
+        self._last_flush = timer()
+
+        if self._widget_size is not None:
+            if self._widget_size != self._sent_widget_size:
+                logg.trace(f"Resizing to {self._widget_size}")
+                self.model.doResize(*self._widget_size)
+                self._sent_widget_size = self._widget_size
+            self._widget_size = None
+
+        if self._zoom_steps != 0:
+            logg.trace(f"Zooming {self._zoom_steps} steps")
+            direction = "in" if self._zoom_steps > 0 else "out"
+            self.model.zoomImage(direction, *self._zoom_pos, abs(self._zoom_steps))
+            self._zoom_steps = 0
+
+        if self._mouse_pos is not None:
+            logg.trace(f"Dragging to {self._mouse_pos}")
+            self.model.moveImageMouse(*self._mouse_pos)
+            self._mouse_pos = None
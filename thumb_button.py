@@ -42,9 +42,11 @@ class ThumbButton(tk.Frame):
             background=self.back_col,
             activebackground=self.hover_back_col,
         )
-        tkimg = ImageTk.PhotoImage(self.photo_info.thumb)
-        self.thumb_label.image = tkimg
-        self.thumb_label.configure(image=tkimg)
+        # if the thumbnail is still being loaded, leave the label empty for now
+        # and let the ThumbButtonList call load_thumb later
+        self.has_thumb = False
+        if not self.photo_info.thumb_is_pending():
+            self.load_thumb()
 
         # photo name
         self.photo_text = tk.Label(
@@ -58,6 +60,13 @@ class ThumbButton(tk.Frame):
         self.thumb_label.grid(row=0, column=0, sticky="ns")
         self.photo_text.grid(row=0, column=1, sticky="nsew")
 
+    def load_thumb(self):
+        """Show the thumbnail in the label"""
+        tkimg = ImageTk.PhotoImage(self.photo_info.thumb)
+        self.thumb_label.image = tkimg
+        self.thumb_label.configure(image=tkimg)
+        self.has_thumb = True
+
     def on_enter(self):
         log = logging.getLogger(f"c.{__class__.__name__}.on_enter")
         #  log.setLevel("TRACE")
@@ -0,0 +1,301 @@
+from os import makedirs
+from os import replace
+from os import stat
+from os.path import getsize
+from os.path import isfile
+from os.path import join
+import logging
+import mmap
+import struct
+import threading
+
+
+class ThumbCache:
+    """Persistent store of thumbnails, packed in a single file
+
+    The file is a header followed by records appended one after the other:
+    each record holds the key (path, file size, mtime) of the pic, the real
+    dimensions and the raw pixels of the thumbnail (see load_thumb_data).
+
+    The file is memory mapped to read the records. An updated pic gets a new
+    record, the old one is dead weight until the next compaction. When the file
+    grows past max_bytes it is compacted, dropping the least recently used
+    entries. The order of use is only kept in memory, it is not saved: when
+    the pack is loaded it is rebuilt from the position of the records, that is
+    the order at the last compaction followed by the records written since,
+    so the thumbnails that were only read lose their place.
+
+    Safe to use from several threads.
+    """
+
+    # magic, version, thumb_size
+    _header = struct.Struct("<8sHH")
+    _magic = b"PVTHUMBS"
+    _version = 1
+    # path_len, size, mtime_ns, width, height, thumb_wid, thumb_hei, data_len, mode
+    _record = struct.Struct("<HqqIIHHI4s")
+
+    def __init__(self, cache_dir, thumb_size=50, max_bytes=256 * 2 ** 20):
+        logg = logging.getLogger(f"c.{__class__.__name__}.init")
+        logg.info(f"Start init in '{cache_dir}'")
+
+        self.cache_dir = cache_dir
+        self.thumb_size = thumb_size
+        self.max_bytes = max_bytes
+
+        makedirs(self.cache_dir, exist_ok=True)
+        self._pack_name = join(self.cache_dir, "thumbs.pack")
+
+        # {path: (size, mtime_ns, offset)} ordered from least to most recently used
+        self._index = {}
+        # bytes in the file that belong to overwritten records
+        self._dead_bytes = 0
+
+        self._mmap = None
+        self._pack_file = None
+        # puts come from the threads that collect the workers results
+        self._lock = threading.RLock()
+        self._open_pack()
+
+        # statistics for the session
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, photo_full, size, mtime_ns):
+        """Return the thumb_data for the pic, None if missing or stale"""
+        logg = logging.getLogger(f"c.{__class__.__name__}.get")
+        #  logg.setLevel("TRACE")
+
+        with self._lock:
+            entry = self._index.get(photo_full)
+            if entry is None or entry[0] != size or entry[1] != mtime_ns:
+                logg.trace(f"Miss '{photo_full}'")
+                self.misses += 1
+                return None
+
+            # mark as most recently used
+            del self._index[photo_full]
+            self._index[photo_full] = entry
+            self.hits += 1
+
+            return self._read_record(entry[2])[1]
+
+    def put(self, photo_full, size, mtime_ns, thumb_data):
+        """Append the thumb_data for the pic"""
+        record = self._pack_record(photo_full, size, mtime_ns, thumb_data)
+        with self._lock:
+            offset = self._pack_file.tell()
+            self._pack_file.write(record)
+
+            old_entry = self._index.pop(photo_full, None)
+            if old_entry is not None:
+                self._dead_bytes += self._record_len(old_entry[2])
+            self._index[photo_full] = (size, mtime_ns, offset)
+
+    def flush(self):
+        """Write the new records on disk, compact if the file is too big"""
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        logg = logging.getLogger(f"c.{__class__.__name__}._flush")
+        self._pack_file.flush()
+
+        pack_bytes = self._pack_file.tell()
+        logg.debug(f"Cache has {len(self._index)} entries in {pack_bytes} bytes")
+        if pack_bytes > self.max_bytes:
+            # leave some room, to not compact at every flush
+            self._compact(int(self.max_bytes * 0.75), False)
+        elif self._dead_bytes > pack_bytes / 2:
+            # mostly stale records
+            self._compact(None, False)
+
+    def compact(self, max_bytes=None, drop_missing=False):
+        """Rewrite the pack with only the live records
+
+        Drop the least recently used entries until the pack fits in max_bytes,
+        if drop_missing also drop the entries whose pic is not on disk anymore
+        """
+        with self._lock:
+            self._compact(max_bytes, drop_missing)
+
+    def _compact(self, max_bytes, drop_missing):
+        logg = logging.getLogger(f"c.{__class__.__name__}._compact")
+        logg.info(f"Compacting cache '{self._pack_name}'")
+
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        self._pack_file.flush()
+
+        # collect the live entries, from the most recently used, until full
+        kept = []
+        tot_bytes = self._header.size
+        for photo_full in reversed(self._index):
+            size, mtime_ns, offset = self._index[photo_full]
+            if drop_missing:
+                try:
+                    st = stat(photo_full)
+                except OSError:
+                    continue
+                if st.st_size != size or st.st_mtime_ns != mtime_ns:
+                    continue
+            record_len = self._record_len(offset)
+            if tot_bytes + record_len > max_bytes:
+                break
+            kept.append(photo_full)
+            tot_bytes += record_len
+
+        # write them back from the least recently used
+        compact_name = f"{self._pack_name}.compact"
+        new_index = {}
+        with open(compact_name, "wb") as f:
+            f.write(self._header.pack(self._magic, self._version, self.thumb_size))
+            for photo_full in reversed(kept):
+                size, mtime_ns, offset = self._index[photo_full]
+                new_index[photo_full] = (size, mtime_ns, f.tell())
+                f.write(self._mmap[offset : offset + self._record_len(offset)])
+
+        logui = logging.getLogger("UI")
+        dropped = len(self._index) - len(new_index)
+        logui.info(f"Thumbnail cache: kept {len(new_index)}, dropped {dropped}")
+
+        self._close_pack()
+        replace(compact_name, self._pack_name)
+        self._open_pack()
+
+    def close(self):
+        with self._lock:
+            self._pack_file.flush()
+            self._close_pack()
+
+    def _open_pack(self):
+        """Open the pack, create it if missing or not valid, and index it"""
+        logg = logging.getLogger(f"c.{__class__.__name__}._open_pack")
+
+        if not self._pack_is_valid():
+            logg.info(f"Creating new cache pack '{self._pack_name}'")
+            with open(self._pack_name, "wb") as f:
+                f.write(self._header.pack(self._magic, self._version, self.thumb_size))
+
+        self._pack_file = open(self._pack_name, "r+b")
+        self._pack_file.seek(0, 2)
+        self._remap()
+        self._scan_pack()
+
+    def _close_pack(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        self._pack_file.close()
+
+    def _pack_is_valid(self):
+        """Check magic, version and thumb_size of an existing pack"""
+        if not isfile(self._pack_name) or getsize(self._pack_name) < self._header.size:
+            return False
+        with open(self._pack_name, "rb") as f:
+            header = f.read(self._header.size)
+        return self._header.unpack(header) == (
+            self._magic,
+            self._version,
+            self.thumb_size,
+        )
+
+    def _remap(self):
+        """Map the whole file, needed after appending to it"""
+        if self._mmap is not None:
+            self._mmap.close()
+        self._mmap = mmap.mmap(self._pack_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _scan_pack(self):
+        """Build the index from the records in the file"""
+        logg = logging.getLogger(f"c.{__class__.__name__}._scan_pack")
+
+        self._index = {}
+        self._dead_bytes = 0
+        offset = self._header.size
+        pack_len = len(self._mmap)
+        while offset + self._record.size <= pack_len:
+            path_len, size, mtime_ns, *_, data_len, _ = self._record.unpack_from(
+                self._mmap, offset
+            )
+            record_len = self._record.size + path_len + data_len
+            if offset + record_len > pack_len:
+                # the last record was truncated, the next put will overwrite it
+                break
+            path_start = offset + self._record.size
+            photo_full = self._mmap[path_start : path_start + path_len].decode()
+
+            old_entry = self._index.pop(photo_full, None)
+            if old_entry is not None:
+                self._dead_bytes += self._record_len(old_entry[2])
+            self._index[photo_full] = (size, mtime_ns, offset)
+            offset += record_len
+
+        # drop a truncated tail
+        if offset < pack_len:
+            logg.warn(f"Dropping {pack_len - offset} bytes at the end of the pack")
+            self._pack_file.truncate(offset)
+            self._remap()
+        self._pack_file.seek(offset)
+        logg.info(f"Found {len(self._index)} thumbnails in cache")
+
+    def _pack_record(self, photo_full, size, mtime_ns, thumb_data):
+        width, height, thumb_mode, thumb_wid, thumb_hei, thumb_bytes = thumb_data
+        path_bytes = photo_full.encode()
+        header = self._record.pack(
+            len(path_bytes),
+            size,
+            mtime_ns,
+            width,
+            height,
+            thumb_wid,
+            thumb_hei,
+            len(thumb_bytes),
+            thumb_mode.encode(),
+        )
+        return header + path_bytes + thumb_bytes
+
+    def _read_record(self, offset):
+        """Return (photo_full, thumb_data) of the record at offset"""
+        if offset + self._record.size > len(self._mmap):
+            # the record was appended after the last mapping
+            self._pack_file.flush()
+            self._remap()
+
+        (
+            path_len,
+            _,
+            _,
+            width,
+            height,
+            thumb_wid,
+            thumb_hei,
+            data_len,
+            thumb_mode,
+        ) = self._record.unpack_from(self._mmap, offset)
+
+        path_start = offset + self._record.size
+        data_start = path_start + path_len
+        if data_start + data_len > len(self._mmap):
+            self._pack_file.flush()
+            self._remap()
+
+        photo_full = self._mmap[path_start:data_start].decode()
+        thumb_bytes = self._mmap[data_start : data_start + data_len]
+        thumb_mode = thumb_mode.rstrip(b"\0").decode()
+        return photo_full, (
+            width,
+            height,
+            thumb_mode,
+            thumb_wid,
+            thumb_hei,
+            thumb_bytes,
+        )
+
+    def _record_len(self, offset):
+        """Length in bytes of the record at offset"""
+        if offset + self._record.size > len(self._mmap):
+            self._pack_file.flush()
+            self._remap()
+        path_len, *_, data_len, _ = self._record.unpack_from(self._mmap, offset)
+        return self._record.size + path_len + data_len
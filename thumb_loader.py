@@ -0,0 +1,157 @@
+from concurrent.futures import BrokenExecutor
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from os import cpu_count
+from os import stat
+import logging
+import multiprocessing
+import threading
+
+from photo_info import load_thumb_data
+
+
+class ThumbLoader:
+    """Decode and shrink pics in the background, in a pool of worker processes
+
+    The workers only send back the compact thumbnail data (see load_thumb_data),
+    the caller gets a Future for each pic and hands it to the PhotoInfo.
+    If a ThumbCache is given, the pics found there are not decoded at all, and
+    the new thumbnails are added to it as soon as the workers finish them.
+    """
+
+    def __init__(
+        self, thumb_size=50, num_workers=None, thumb_cache=None, thumb_mode="draft"
+    ):
+        logg = logging.getLogger(f"c.{__class__.__name__}.init")
+        logg.info("Start init")
+
+        self.thumb_size = thumb_size
+        # how to decode the pics, see load_thumb_data
+        self.thumb_mode = thumb_mode
+
+        # default to one worker per core
+        if num_workers is None or num_workers < 1:
+            num_workers = cpu_count() or 1
+        self.num_workers = num_workers
+        logg.info(f"Using {self.num_workers} thumbnail workers")
+
+        self.thumb_cache = thumb_cache
+
+        # {photo_full: (size, mtime_ns)} of the pics missing from the cache
+        self._cache_keys = {}
+        # Futures not done yet, the cache is flushed when they are all done
+        self._pending = 0
+        # the done callbacks run in another thread
+        self._lock = threading.Lock()
+
+        # the pool is created when first needed, and reused after that
+        self._executor = None
+
+    def lookup(self, photo_list, get_stat_key=None):
+        """Find the pics in the cache
+
+        get_stat_key(photo_full) can provide the (size, mtime_ns) of the pic if
+        already known, to skip the stat
+
+        Returns ({photo_full: thumb_data}, [photo_full]) with the cached pics
+        and the ones that need a worker. Pics that can't be read are skipped.
+        """
+        logg = logging.getLogger(f"c.{__class__.__name__}.lookup")
+        #  logg.setLevel("TRACE")
+        logg.info(f"Looking up {len(photo_list)} thumbnails")
+
+        cached = {}
+        missing = []
+        for photo_full in photo_list:
+            key = None if get_stat_key is None else get_stat_key(photo_full)
+            if key is None:
+                try:
+                    st = stat(photo_full)
+                except OSError as e:
+                    logg.warn(f"Failed to stat '{photo_full}': {e}")
+                    continue
+                key = (st.st_size, st.st_mtime_ns)
+
+            if self.thumb_cache is not None:
+                thumb_data = self.thumb_cache.get(photo_full, *key)
+                if thumb_data is not None:
+                    cached[photo_full] = thumb_data
+                    continue
+
+            with self._lock:
+                self._cache_keys[photo_full] = key
+            missing.append(photo_full)
+
+        logg.info(f"Found {len(cached)} cached, {len(missing)} to decode")
+        return cached, missing
+
+    def submit(self, photo_full):
+        """Return a Future for the thumb_data of the pic
+
+        Work is done in submission order, so submit the first pics shown first
+        """
+        logg = logging.getLogger(f"c.{__class__.__name__}.submit")
+        #  logg.setLevel("TRACE")
+        logg.trace(f"Submitting '{photo_full}'")
+
+        try:
+            future = self._get_executor().submit(
+                load_thumb_data, photo_full, self.thumb_size, self.thumb_mode
+            )
+        except BrokenExecutor as e:
+            # a worker died, the pool can't be used anymore: start a new one
+            logg.warn(f"Restarting the thumbnail workers: {e!r}")
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            future = self._get_executor().submit(
+                load_thumb_data, photo_full, self.thumb_size, self.thumb_mode
+            )
+        with self._lock:
+            self._pending += 1
+        future.add_done_callback(lambda f: self._on_done(photo_full, f))
+        return future
+
+    def _on_done(self, photo_full, future):
+        """Save the new thumbnail in the cache, flush it when the batch is over
+
+        Failures are reported by the PhotoInfo when the thumbnail is accessed
+        """
+        logg = logging.getLogger(f"c.{__class__.__name__}._on_done")
+        #  logg.setLevel("TRACE")
+        logg.trace(f"Done '{photo_full}'")
+
+        with self._lock:
+            self._pending -= 1
+            key = self._cache_keys.pop(photo_full, None)
+            batch_done = self._pending == 0
+
+        if self.thumb_cache is None:
+            return
+        if not future.cancelled() and future.exception() is None and key is not None:
+            self.thumb_cache.put(photo_full, *key, future.result())
+        if batch_done:
+            self.thumb_cache.flush()
+
+    def _get_executor(self):
+        """Create the pool if needed
+
+        Use spawn: forking a process that runs the Tk mainloop is asking for trouble
+        With a single worker a background thread is enough
+        """
+        if self._executor is None:
+            if self.num_workers == 1:
+                self._executor = ThreadPoolExecutor(max_workers=1)
+            else:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.num_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+        return self._executor
+
+    def close(self):
+        """Shut down the workers and close the cache"""
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
+        if self.thumb_cache is not None:
+            self.thumb_cache.close()
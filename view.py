@@ -4,17 +4,24 @@ import logging
 from tkinter import font as tkfont
 import tkinter as tk
 
+from PIL import Image  # type: ignore
+from PIL import ImageTk  # type: ignore
+
 from scrollable_frame import ScrollableFrame
 from thumb_button import ThumbButton
 from color_palette import Palette
 
 
 class View:
-    def __init__(self, root):
+    def __init__(self, root, display_backend="label"):
         logg = logging.getLogger(f"c.{__class__.__name__}.init")
         logg.info("Start init")
 
         self.root = root
+        # widget that shows the cropped photos, see FrameCrop
+        self.display_backend = display_backend
+        # the frames showing the same crop share the PhotoImage
+        self.photo_share = PhotoShare()
         # TODO get theme from Controller
         # TODO change theme at runtime...
         self.palette = Palette("blue1")
@@ -48,10 +55,18 @@ class View:
 
         # create frames for photo and info panels
         self.frame_crop_prim = FrameCrop(
-            self.root, name="frame_crop.prim", palette=self.palette
+            self.root,
+            name="frame_crop.prim",
+            palette=self.palette,
+            display_backend=self.display_backend,
+            photo_share=self.photo_share,
         )
         self.frame_crop_echo = FrameCrop(
-            self.root, name="frame_crop.echo", palette=self.palette
+            self.root,
+            name="frame_crop.echo",
+            palette=self.palette,
+            display_backend=self.display_backend,
+            photo_share=self.photo_share,
         )
         self.frame_metadata = FrameMetadata(
             self.root,
@@ -174,13 +189,63 @@ class View:
         self.root.destroy()
 
 
+class PhotoShare:
+    """The PhotoImages shown by the FrameCrop, to share them between frames
+
+    When many frames show the same PIL image, e.g. prim and echo on the same
+    photo with the same zoom, it is converted in a PhotoImage only once.
+    """
+
+    def __init__(self):
+        # {frame name: (PIL image, PhotoImage)} shown in each frame
+        self._shown = {}
+
+    def find(self, image):
+        """The PhotoImage of the image if a frame shows it, else None"""
+        for shown_image, photo in self._shown.values():
+            if shown_image is image:
+                return photo
+        return None
+
+    def is_shown_elsewhere(self, name, photo):
+        """True if a frame other than name shows the PhotoImage"""
+        return any(p is photo for n, (_, p) in self._shown.items() if n != name)
+
+    def show(self, name, image, photo):
+        """The frame name now shows the image in the PhotoImage"""
+        self._shown[name] = (image, photo)
+
+
 class FrameCrop(tk.Frame):
-    def __init__(self, parent, name, palette, *args, **kwargs):
+    """Frame that shows a cropped photo
+
+    With the label display_backend every crop becomes a new PhotoImage set in
+    a Label, that shrinks around it. With the canvas one the Canvas fills the
+    frame and shows a single PhotoImage as big as the canvas: each crop is
+    centered on the background and pasted in it, so panning and zooming reuse
+    the same Tk image, that is replaced only when the canvas is resized.
+
+    With a photo_share, a crop already shown by another frame reuses its
+    PhotoImage.
+    """
+
+    def __init__(
+        self,
+        parent,
+        name,
+        palette,
+        *args,
+        display_backend="label",
+        photo_share=None,
+        **kwargs,
+    ):
         logg = logging.getLogger(f"c.{__class__.__name__}.init")
         logg.info("Start init")
 
         self.name = name
         self.palette = palette
+        self.display_backend = display_backend
+        self.photo_share = photo_share
         back_col = self.palette.get_colors(f"background.{self.name}")
 
         super().__init__(parent, background=back_col, *args, **kwargs)
@@ -189,6 +254,16 @@ class FrameCrop(tk.Frame):
         self.grid_rowconfigure(0, weight=1)
         self.grid_columnconfigure(0, weight=1)
 
+        # the PhotoImage shown, it can belong to another frame
+        self._photo = None
+        # the PhotoImage of this frame, and the size it was created for
+        self._own_photo = None
+        self._own_photo_key = None
+
+        if self.display_backend == "canvas":
+            self._setup_canvas()
+            return
+
         # create the label that will hold the image
         self.image_label = tk.Label(
             self, text="Mock up FrameCrop", background=self.cget("background")
@@ -204,31 +279,174 @@ class FrameCrop(tk.Frame):
         # but the size of the columns is determined by
         # grid_columnconfigure(uniform='half')
 
+    def _setup_canvas(self):
+        """Create the canvas that fills the frame, with an empty image item"""
+        # the size is set by the frame, don't ask for any
+        self.image_canvas = tk.Canvas(
+            self,
+            background=self.cget("background"),
+            highlightthickness=0,
+            width=0,
+            height=0,
+        )
+        self.image_canvas.grid(row=0, column=0, sticky="nsew")
+        self._image_item = self.image_canvas.create_image(0, 0, anchor="nw")
+        # the crop shown, its size and top left corner in the canvas
+        self._shown_data = None
+        self._image_size = (0, 0)
+        self._image_offset = (0, 0)
+        # the PhotoImage covers the canvas, the crop is centered on it
+        red, green, blue = self.winfo_rgb(self.cget("background"))
+        self._back_rgb = (red >> 8, green >> 8, blue >> 8)
+        self.image_canvas.bind("<Configure>", self._resized_canvas)
+
+        # the canvas covers the frame, the scroll events are sent to the
+        # image or the frame callbacks depending on where the mouse is
+        self._scroll_image_func = None
+        self._scroll_frame_func = None
+        self.image_canvas.bind("<4>", self._scrolled_canvas)
+        self.image_canvas.bind("<5>", self._scrolled_canvas)
+        self.image_canvas.bind("<MouseWheel>", self._scrolled_canvas)
+
     def update_image(self, data):
-        """Update the image in the label"""
+        """Show the PIL image data"""
         logg = logging.getLogger(f"c.{__class__.__name__}.update_image")
-        logg.trace("Updating image_label")
-        self.image_label.configure(image=data)
+        logg.trace(f"Updating image with {self.display_backend}")
+        if data is None:
+            return
+
+        if self.display_backend == "canvas":
+            self._place_image(data)
+
+        photo = None
+        if self.photo_share is not None:
+            photo = self.photo_share.find(data)
+        if photo is not None and self.display_backend == "canvas":
+            # the PhotoImage of another frame has the size of that canvas
+            if (photo.width(), photo.height()) != self._get_canvas_size():
+                photo = None
+        if photo is None:
+            photo = self._make_photo(data)
+        else:
+            logg.trace("Sharing the PhotoImage of another frame")
+        if self.photo_share is not None:
+            self.photo_share.show(self.name, data, photo)
+
+        if photo is self._photo:
+            # pasted in the image already shown
+            return
+        # keep a reference, or the PhotoImage is garbage collected
+        self._photo = photo
+        if self.display_backend == "label":
+            self.image_label.configure(image=self._photo)
+            return
+        self.image_canvas.itemconfigure(self._image_item, image=self._photo)
+
+    def _make_photo(self, data):
+        """Convert data in a PhotoImage, reusing the one of the frame if possible"""
+        if self.display_backend == "label":
+            return ImageTk.PhotoImage(data)
+
+        # the crop in the middle of an image as big as the canvas
+        photo_key = self._get_canvas_size()
+        canvas_image = Image.new("RGB", photo_key, self._back_rgb)
+        canvas_image.paste(data, self._image_offset)
+
+        can_paste = photo_key == self._own_photo_key
+        if can_paste and self.photo_share is not None:
+            # the other frames showing it would change too
+            can_paste = not self.photo_share.is_shown_elsewhere(
+                self.name, self._own_photo
+            )
+        if can_paste:
+            # same size, copy the pixels in the image
+            self._own_photo.paste(canvas_image)
+        else:
+            self._own_photo = ImageTk.PhotoImage(canvas_image)
+            self._own_photo_key = photo_key
+        return self._own_photo
+
+    def _get_canvas_size(self):
+        """Size of the canvas, at least 1x1 before it is mapped"""
+        return (
+            max(self.image_canvas.winfo_width(), 1),
+            max(self.image_canvas.winfo_height(), 1),
+        )
+
+    def _place_image(self, data):
+        """Save the size and position of the crop, centered in the canvas"""
+        self._shown_data = data
+        canvas_wid, canvas_hei = self._get_canvas_size()
+        self._image_size = data.size
+        self._image_offset = (
+            (canvas_wid - data.width) // 2,
+            (canvas_hei - data.height) // 2,
+        )
+
+    def _resized_canvas(self, event):
+        """Draw the crop shown again, in a PhotoImage of the new size"""
+        if self._shown_data is None:
+            return
+        self.update_image(self._shown_data)
+
+    def _to_image_coords(self, event):
+        """Make the event position relative to the image, as in the label"""
+        event.x -= self._image_offset[0]
+        event.y -= self._image_offset[1]
+        return event
+
+    def _is_on_image(self, event):
+        """True if the event is on the crop, not on the background around it"""
+        if self._photo is None:
+            return False
+        offset_x, offset_y = self._image_offset
+        on_image = 0 <= event.x - offset_x < self._image_size[0]
+        on_image &= 0 <= event.y - offset_y < self._image_size[1]
+        return on_image
+
+    def _scrolled_canvas(self, event):
+        """Send the scroll to the image callback if on the image"""
+        on_image = self._is_on_image(event)
+        if on_image and self._scroll_image_func is not None:
+            self._scroll_image_func(self._to_image_coords(event))
+        elif not on_image and self._scroll_frame_func is not None:
+            self._scroll_frame_func(event)
 
     def bind_mouse_scroll_label(self, func):
         """Bind mouse scroll events *only* to image_label"""
+        if self.display_backend == "canvas":
+            self._scroll_image_func = func
+            return
         self.image_label.bind("<4>", func)
         self.image_label.bind("<5>", func)
         self.image_label.bind("<MouseWheel>", func)
 
     def bind_mouse_scroll_frame(self, func):
         """Bind mouse scroll events *only* to image_frame"""
+        if self.display_backend == "canvas":
+            self._scroll_frame_func = func
         self.bind("<4>", func)
         self.bind("<5>", func)
         self.bind("<MouseWheel>", func)
 
     def bind_image(self, kind, func):
         """Bind event 'kind' to func *only* on image_label"""
+        if self.display_backend == "canvas":
+            # the image item covers the canvas, skip the background
+            def on_image_func(event):
+                if self._is_on_image(event):
+                    func(self._to_image_coords(event))
+
+            self.image_canvas.tag_bind(self._image_item, kind, on_image_func)
+            return
         self.image_label.bind(kind, func)
 
     def bind_to_all(self, kind, func):
         """Bind event 'kind' to func on *both* image_label and frame"""
         self.bind(kind, func)
+        if self.display_backend == "canvas":
+            self.image_canvas.bind(kind, func)
+            return
         self.image_label.bind(kind, func)
 
 
@@ -602,6 +820,43 @@ class ThumbButtonList(tk.Frame):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
+        # ThumbButtons still waiting for their thumbnail
+        self._pending_thumbbtn = []
+        self._fill_thumbs_id = None
+        # how often to check for new thumbnails, in ms
+        self._fill_thumbs_delay = 100
+
+    def fill_thumb_later(self, thumbbtn):
+        """Load the thumbnail in the ThumbButton when it is ready"""
+        if thumbbtn.has_thumb:
+            return
+        self._pending_thumbbtn.append(thumbbtn)
+        if self._fill_thumbs_id is None:
+            self._fill_thumbs_id = self.after(
+                self._fill_thumbs_delay, self._fill_thumbs
+            )
+
+    def _fill_thumbs(self):
+        """Show the thumbnails that are ready, check again later for the others"""
+        logg = logging.getLogger(f"c.{__class__.__name__}._fill_thumbs")
+        #  logg.setLevel("TRACE")
+
+        still_pending = []
+        for thumbbtn in self._pending_thumbbtn:
+            if thumbbtn.photo_info.thumb_is_pending():
+                still_pending.append(thumbbtn)
+            else:
+                thumbbtn.load_thumb()
+        logg.trace(f"Filled {len(self._pending_thumbbtn) - len(still_pending)}")
+        self._pending_thumbbtn = still_pending
+
+        if len(self._pending_thumbbtn) > 0:
+            self._fill_thumbs_id = self.after(
+                self._fill_thumbs_delay, self._fill_thumbs
+            )
+        else:
+            self._fill_thumbs_id = None
+
     def on_thumbbtn_enter(self, event):
         logg = logging.getLogger(f"c.{__class__.__name__}.on_thumbbtn_enter")
         #  logg.setLevel("TRACE")
@@ -729,6 +984,9 @@ class SelectionListFrame(ThumbButtonList):
                     self.on_selection_list_doubleclick
                 )
 
+                # show the thumbnail when it's loaded
+                self.fill_thumb_later(self.selection_list_thumbbtn[pic])
+
             # set selected photo to FIRST, de-selected to BIS color_mode
             if is_selected:
                 self.selection_list_thumbbtn[pic].set_back_col_mode("FIRST")
@@ -823,20 +1081,35 @@ class PhotoListFrame(ThumbButtonList):
         # dicts for runtime elements
         self.photo_list_thumbbtn = {}
         self.current_photo_prim = ""
+        # pics of the ThumbButton gridded, in row order
+        self.photo_list_gridded = []
 
     def update_photo_list(self, photo_list_info):
         """Receives a dict of PhotoInfo object and creates ThumbButton
 
         photo_list_info = { pic : PhotoInfo }
+
+        The rows that did not change are left alone, only the ThumbButton after
+        the first difference are gridded again: while a folder is scanned the
+        new photos are at the end, and only those are added
         """
         logg = logging.getLogger(f"c.{__class__.__name__}.update_photo_list")
         #  logg.setLevel("TRACE")
         logg.info("Updating photo_list ThumbButton")
 
-        for pic in self.photo_list_thumbbtn:
+        new_gridded = list(photo_list_info)
+        same_rows = 0
+        for old_pic, new_pic in zip(self.photo_list_gridded, new_gridded):
+            if old_pic != new_pic:
+                break
+            same_rows += 1
+        logg.trace(f"Keeping {same_rows} rows of {len(self.photo_list_gridded)}")
+
+        for pic in self.photo_list_gridded[same_rows:]:
             self.photo_list_thumbbtn[pic].grid_forget()
+        self.photo_list_gridded = new_gridded
 
-        for ri, pic in enumerate(photo_list_info):
+        for ri, pic in enumerate(new_gridded[same_rows:], start=same_rows):
             # create the new ThumbButton
             if pic not in self.photo_list_thumbbtn:
                 self.photo_list_thumbbtn[pic] = ThumbButton(
@@ -861,6 +1134,9 @@ class PhotoListFrame(ThumbButtonList):
                     self.on_photo_list_doubleclick
                 )
 
+                # show the thumbnail when it's loaded
+                self.fill_thumb_later(self.photo_list_thumbbtn[pic])
+
             # highlight current photo primary
             if pic == self.current_photo_prim:
                 logg.trace(f"Setting color mode BIS for '{pic}' ThumbButton")